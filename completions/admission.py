@@ -0,0 +1,177 @@
+import contextlib
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+
+STATS_FILE = 'stats.json'
+
+
+class SandboxBusy(Throttled):
+    """Sandbox can't take more work now, answered with 429 and `Retry-After`"""
+
+    default_detail = 'Sandbox is busy.'
+    default_code = 'sandbox_busy'
+
+
+def get_slots_dir() -> Path:
+    directory = Path(settings.SANDBOX_SLOTS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def try_lock(prefix: str, count: int) -> int | None:
+    """Locks first free of `count` lock files, returns its descriptor or None when all are locked
+
+    Lock is held by open file, so it's released when descriptor is closed or process dies.
+    """
+    directory = get_slots_dir()
+    for number in range(count):
+        fd = os.open(directory / f'{prefix}-{number}', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        return fd
+    return None
+
+
+def count_locked(prefix: str, count: int) -> int:
+    locked = 0
+    directory = get_slots_dir()
+    for number in range(count):
+        fd = os.open(directory / f'{prefix}-{number}', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            locked += 1
+        finally:
+            os.close(fd)
+    return locked
+
+
+@contextlib.contextmanager
+def update_stats():
+    """Yields admission stats of host, changes made to them are saved"""
+    with open(get_slots_dir() / STATS_FILE, 'a+') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        file.seek(0)
+        try:
+            stats = json.loads(file.read())
+        except ValueError:
+            stats = {'admitted': 0, 'rejected': 0, 'waited': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+        yield stats
+        file.seek(0)
+        file.truncate()
+        file.write(json.dumps(stats))
+
+
+def is_waiting(priority: int) -> bool:
+    """Whether caller of priority class higher than `priority` waits for slot
+
+    Waiting callers hold shared lock of file of their class, so it can't be locked exclusively.
+    """
+    directory = get_slots_dir()
+    for higher in range(priority):
+        fd = os.open(directory / f'waiting-{higher}', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+    return False
+
+
+def take_slot(priority: int) -> int | None:
+    """Locks free slot unless caller of higher priority class waits for it"""
+    if priority and is_waiting(priority):
+        return None
+    return try_lock('slot', settings.SANDBOX_SLOTS)
+
+
+def record_admission(wait: float):
+    with update_stats() as stats:
+        stats['admitted'] += 1
+        if wait > 0:
+            stats['waited'] += 1
+            stats['wait_total'] += wait
+            stats['wait_max'] = max(stats['wait_max'], wait)
+
+
+def reject() -> SandboxBusy:
+    with update_stats() as stats:
+        stats['rejected'] += 1
+    return SandboxBusy(wait=settings.SANDBOX_RETRY_AFTER)
+
+
+def wait_for_slot(started_at: float, queue_timeout: float | None, priority: int) -> int:
+    """Polls for free slot, callers with timeout take place in bounded wait queue first
+
+    While caller waits, callers of lower priority classes don't take free slots.
+    """
+    queue_fd = None
+    if queue_timeout is not None:
+        queue_fd = try_lock('queue', settings.SANDBOX_QUEUE_SIZE)
+        if queue_fd is None:
+            raise reject()
+    waiting_fd = os.open(get_slots_dir() / f'waiting-{priority}', os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(waiting_fd, fcntl.LOCK_SH)
+        while True:
+            time.sleep(settings.SANDBOX_SLOT_POLL_INTERVAL)
+            fd = take_slot(priority)
+            if fd is not None:
+                return fd
+            if queue_timeout is not None and time.monotonic() - started_at >= queue_timeout:
+                raise reject()
+    finally:
+        os.close(waiting_fd)
+        if queue_fd is not None:
+            os.close(queue_fd)
+
+
+@contextlib.contextmanager
+def sandbox_slot(queue_timeout: float | None = None, priority: int = 0):
+    """Holds one of `SANDBOX_SLOTS` slots shared by all processes of host while sandbox runs
+
+    Caller that doesn't get slot at once waits in queue of `SANDBOX_QUEUE_SIZE` places
+    for at most `queue_timeout` seconds, `SandboxBusy` is raised when queue is full or time is out.
+    Without timeout caller waits until slot is free, it's for workers that have their own queue.
+    `priority` is class of `GradingJob`, free slot goes to waiting caller of the highest class.
+    """
+    if settings.SANDBOX_SLOTS <= 0:
+        yield
+        return
+    started_at = time.monotonic()
+    fd = take_slot(priority)
+    if fd is None:
+        fd = wait_for_slot(started_at, queue_timeout, priority)
+        record_admission(time.monotonic() - started_at)
+    else:
+        record_admission(0)
+    try:
+        yield
+    finally:
+        os.close(fd)
+
+
+def get_sandbox_metrics() -> dict:
+    with update_stats() as stats:
+        stats = dict(stats)
+    return {
+        'slots': settings.SANDBOX_SLOTS,
+        'slots_in_use': count_locked('slot', settings.SANDBOX_SLOTS),
+        'queue_size': settings.SANDBOX_QUEUE_SIZE,
+        'queue_depth': count_locked('queue', settings.SANDBOX_QUEUE_SIZE),
+        'admitted': stats['admitted'],
+        'rejected': stats['rejected'],
+        'waited': stats['waited'],
+        'wait_mean': stats['wait_total'] / stats['waited'] if stats['waited'] else 0.0,
+        'wait_max': stats['wait_max'],
+    }
@@ -0,0 +1,160 @@
+import contextlib
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+
+from questions.models import Test, Variant
+
+from .models import Answer, CheckAnswerBody, Completion, RadioAnswerBody, TextAnswerBody
+from .scoring import annotate_points
+
+# answers read from server-side cursor and written to matrix at once
+CHUNK_SIZE = 5000
+
+
+@contextlib.contextmanager
+def snapshot():
+    """Transaction in which all queries see the same state of database
+
+    Nested in another transaction it takes isolation level of that transaction.
+    """
+    in_transaction = connection.in_atomic_block
+    with transaction.atomic():
+        if not in_transaction:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+def get_score_matrix(test: Test, completion_ids: np.ndarray, question_ids: np.ndarray):
+    """Builds completion x question matrix of points of graded completions
+
+    Rows and columns are in order of `completion_ids` and `question_ids`, which must be sorted.
+    Answers of completions that are not in `completion_ids` are skipped, as are answers
+    to questions of other tests.
+    Second matrix marks answered questions.
+    """
+    scores = np.zeros((len(completion_ids), len(question_ids)))
+    answered = np.zeros(scores.shape, dtype=bool)
+    answers = annotate_points(
+        Answer.objects.filter(completion__test=test, completion__status='graded', question__test=test)
+    ).values_list('completion_id', 'question_id', 'computed_points').order_by()
+    rows = answers.iterator(chunk_size=CHUNK_SIZE)
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        data = np.array(chunk, dtype=float)
+        # completion may be graded after its ids were read, when not in the same snapshot
+        data = data[np.isin(data[:, 0], completion_ids)]
+        row = np.searchsorted(completion_ids, data[:, 0])
+        column = np.searchsorted(question_ids, data[:, 1])
+        scores[row, column] = data[:, 2]
+        answered[row, column] = True
+    return scores, answered
+
+
+def get_discrimination(scores: np.ndarray) -> np.ndarray:
+    """Correlation of points for every question with points for the rest of test
+
+    Question is excluded from total, so it doesn't correlate with itself.
+    Questions that everyone answered the same way get nan.
+    """
+    rest = scores.sum(axis=1, keepdims=True) - scores
+    item = scores - scores.mean(axis=0)
+    rest = rest - rest.mean(axis=0)
+    denominator = np.sqrt((item ** 2).sum(axis=0) * (rest ** 2).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, (item * rest).sum(axis=0) / denominator, np.nan)
+
+
+def get_variant_counts(test: Test) -> dict[int, int]:
+    """Number of graded completions that picked every variant of test"""
+    counts = {}
+    filters = {'answer__completion__test': test, 'answer__completion__status': 'graded', 'answer__question__test': test}
+    for Body in (TextAnswerBody, RadioAnswerBody):
+        picked = Body.objects.filter(**filters).values('picked_variant').annotate(count=Count('pk')).order_by()
+        counts.update((row['picked_variant'], row['count']) for row in picked)
+    picked = (
+        CheckAnswerBody.picked_variants.through.objects
+        .filter(**{f'checkanswerbody__{lookup}': value for lookup, value in filters.items()})
+        .values('variant').annotate(count=Count('pk')).order_by()
+    )
+    counts.update((row['variant'], row['count']) for row in picked)
+    return counts
+
+
+def to_float(value) -> float | None:
+    return None if np.isnan(value) else float(value)
+
+
+def compute_item_analysis(test: Test) -> dict:
+    """Difficulty, discrimination and distractor frequencies of every question of test"""
+    completion_ids = np.fromiter(
+        Completion.objects.filter(test=test, status='graded').order_by('pk').values_list('pk', flat=True),
+        dtype=float,
+    )
+    questions = list(test.questions.order_by('number_in_test').values('pk', 'number_in_test', 'type', 'points'))  # type: ignore
+    question_ids = np.sort(np.array([question['pk'] for question in questions], dtype=float))
+    scores, answered = get_score_matrix(test, completion_ids, question_ids)
+
+    total = len(completion_ids)
+    nan = np.full(len(question_ids), np.nan)
+    mean_points = scores.mean(axis=0) if total else nan
+    max_points = np.array([question['points'] for question in sorted(questions, key=lambda q: q['pk'])], dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        difficulty = np.where(max_points > 0, mean_points / max_points, np.nan)
+    discrimination = get_discrimination(scores) if total else nan
+    answered_count = answered.sum(axis=0)
+
+    variants = Variant.objects.group_by_question('test', test)
+    variant_counts = get_variant_counts(test)
+    items = []
+    for question in questions:
+        column = int(np.searchsorted(question_ids, question['pk']))
+        items.append({
+            'question': question['pk'],
+            'number_in_test': question['number_in_test'],
+            'type': question['type'],
+            'points': question['points'],
+            'answered': int(answered_count[column]),
+            'omitted': total - int(answered_count[column]),
+            'mean_points': to_float(mean_points[column]),
+            'difficulty': to_float(difficulty[column]),
+            'discrimination': to_float(discrimination[column]),
+            'variants': [
+                {
+                    'variant': variant.pk,
+                    'text': variant.text,
+                    'is_correct': variant.is_correct,
+                    'count': variant_counts.get(variant.pk, 0),
+                    'frequency': variant_counts.get(variant.pk, 0) / total if total else None,
+                }
+                for variant in variants[question['pk']]
+            ],
+        })
+    return {
+        'completions': total,
+        'mean_score': float(scores.sum(axis=1).mean()) if total else None,
+        'questions': items,
+    }
+
+
+def get_item_analysis(test: Test) -> dict:
+    """Returns item analysis of test from cache
+
+    Entry is bound to content version of test and to state of its graded completions,
+    so new and regraded completions make new entry. State and analysis are read
+    from one snapshot, so entry matches its key.
+    """
+    with snapshot():
+        state = Completion.objects.filter(test=test, status='graded').aggregate(
+            count=Count('pk'), last=Max('pk'), total=Sum('score')
+        )
+        key = f'item-analysis:{test.pk}:{test.content_version}:{state["count"]}:{state["last"]}:{state["total"]}'
+        analysis = cache.get(key)
+        if analysis is None:
+            analysis = compute_item_analysis(test)
+            cache.set(key, analysis, timeout=settings.ITEM_ANALYSIS_CACHE_TIMEOUT)
+    return analysis
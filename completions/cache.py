@@ -0,0 +1,83 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def normalize_code(code: str) -> str:
+    """Removes differences that don't change program behaviour: line endings and trailing whitespace"""
+    return code.replace('\r\n', '\n').rstrip()
+
+
+def make_key(code: str, testing_code: str, limits: tuple) -> str:
+    """Content address of sandbox run"""
+    digest = hashlib.sha256()
+    for part in (normalize_code(code), normalize_code(testing_code), repr(limits)):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class SandboxResultCache:
+    """Bounded LRU cache of sandbox run results of the process
+
+    Entries are remembered by code body they were made for, so they can be dropped
+    when testing code of question changes.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[int, dict]] = OrderedDict()
+        self._keys_by_body: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, result: dict, body_id: int):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._forget_key(key, self._entries[key][0])
+            self._entries[key] = (body_id, result)
+            self._entries.move_to_end(key)
+            self._keys_by_body.setdefault(body_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, (old_body_id, _) = self._entries.popitem(last=False)
+                self._forget_key(old_key, old_body_id)
+
+    def invalidate_body(self, body_id: int):
+        """Drops all results of code body"""
+        with self._lock:
+            for key in self._keys_by_body.pop(body_id, ()):
+                self._entries.pop(key, None)
+
+    def _forget_key(self, key: str, body_id: int):
+        keys = self._keys_by_body.get(body_id)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_body[body_id]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+result_cache = SandboxResultCache(settings.SANDBOX_RESULT_CACHE_SIZE)
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .admission import reject
+from .models import GradingJob
+from .utils import check_code, get_check_key, get_limits
+
+
+def limit_errors(result: dict) -> dict:
+    """Result shown to student, only the end of errors is kept
+
+    Errors are output of code, which may be anything code could read, so they are
+    never passed to student in full.
+    """
+    limit = settings.DRY_RUN_ERRORS_LIMIT
+    errors = result['errors']
+    if len(errors) > limit:
+        errors = '...\n' + errors[len(errors) - limit:]
+    return {**result, 'errors': errors}
+
+
+def dry_run(code: str, code_body) -> dict:
+    """Checks code answer to question without saving it, errors of result are limited by `limit_errors`"""
+    return limit_errors(check_once(code, code_body))
+
+
+def check_once(code: str, code_body) -> dict:
+    """Checks code answer to question, same code is run only once
+
+    Result is kept in shared cache by content of code and question. Identical requests
+    that come while code runs wait for result of the first one instead of running it again.
+    Code is run in interactive priority class, `SandboxBusy` is raised when no sandbox slot
+    is free in `SANDBOX_QUEUE_TIMEOUT` seconds or the first request doesn't finish in time.
+    """
+    key = f'dry-run:{get_check_key(code, code_body)}'
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    # time of sandbox run and waiting for free slot
+    cases = len(code_body.io_cases) if code_body.grading_mode == 'io' else 1
+    run_timeout = get_limits(code_body).wall_time * max(cases, 1) + settings.SANDBOX_QUEUE_TIMEOUT + 5
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, timeout=run_timeout):
+        try:
+            result = check_code(code, code_body, settings.SANDBOX_QUEUE_TIMEOUT, GradingJob.INTERACTIVE)
+            # timeout may be caused by load of host, so such result is not reused
+            if not result['is_timed_out']:
+                cache.set(key, result, timeout=settings.DRY_RUN_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return result
+
+    deadline = time.monotonic() + run_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        result = cache.get(key)
+        if result is not None:
+            return result
+        if cache.get(lock_key) is None:
+            break
+    else:
+        # first request is stuck, running code once more would only add load
+        raise reject()
+    # first request failed or its result isn't reusable
+    return check_code(code, code_body, settings.SANDBOX_QUEUE_TIMEOUT, GradingJob.INTERACTIVE)
@@ -0,0 +1,274 @@
+import asyncio
+import base64
+import contextvars
+import json
+import logging
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import BigIntegerField, OuterRef, Q, Subquery
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from questions.models import Test
+
+from .models import CodeAnswerBody, Completion
+
+logger = logging.getLogger(__name__)
+
+
+def authenticate(request):
+    """Returns user authenticated by the same classes as API views, None for anonymous or invalid credentials"""
+    request = Request(request, authenticators=[cls() for cls in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = request.user
+    except APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+def format_event(event: str, data: dict) -> str:
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def run_shared(func, *args):
+    """Runs sync function in thread shared by all requests of process
+
+    Django runs sync code of every async request in its own thread with its own database
+    connection, which waiting requests would hold. Task started with empty context uses
+    single thread of process instead, so all of them share one connection.
+    """
+    task = asyncio.get_running_loop().create_task(sync_to_async(func)(*args), context=contextvars.Context())
+    return await task
+
+
+def get_status_snapshots(completion_ids) -> dict[int, dict]:
+    """Grading status of completions and results of their graded code answers, two queries for all"""
+    snapshots = {
+        row['pk']: {'completion': row['pk'], 'status': row['status'], 'score': row['score'], 'answers': []}
+        for row in Completion.objects.filter(pk__in=completion_ids).values('pk', 'status', 'score')
+    }
+    graded = (
+        CodeAnswerBody.objects.filter(answer__completion__in=completion_ids, is_correct__isnull=False)
+        .values('answer__completion', 'answer', 'answer__question', 'is_correct', 'passed_cases', 'total_cases')
+        .order_by('answer')
+    )
+    for row in graded:
+        snapshots[row.pop('answer__completion')]['answers'].append({
+            'answer': row['answer'],
+            'question': row['answer__question'],
+            'is_correct': row['is_correct'],
+            'passed_cases': row['passed_cases'],
+            'total_cases': row['total_cases'],
+        })
+    return snapshots
+
+
+class Watcher:
+    """Polls state of objects that clients wait for
+
+    One task of event loop fetches states of all watched objects together by `fetch`
+    every `interval` seconds, so idle connections cost no queries of their own.
+    `fetch` is sync function that takes keys and returns states of existing objects by key.
+    """
+
+    def __init__(self, fetch, interval: float):
+        self.fetch = fetch
+        self.interval = interval
+        self.snapshots: dict = {}
+        self.waiters: defaultdict[int, set[asyncio.Event]] = defaultdict(set)
+        self.task: asyncio.Task | None = None
+
+    async def get(self, key):
+        if key in self.snapshots:
+            return self.snapshots[key]
+        return (await run_shared(self.fetch, [key])).get(key)
+
+    async def wait(self, key, snapshot, timeout: float):
+        """Waits until state differs from `snapshot` or timeout expires, returns current state, None if object is gone"""
+        self.snapshots.setdefault(key, snapshot)
+        if self.snapshots[key] != snapshot:
+            return self.snapshots[key]
+        event = asyncio.Event()
+        self.waiters[key].add(event)
+        if self.task is None:
+            # poller outlives request that started it, so it doesn't take context of request
+            self.task = asyncio.get_running_loop().create_task(self.poll(), context=contextvars.Context())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except TimeoutError:
+            pass
+        finally:
+            self.waiters[key].discard(event)
+            if not self.waiters[key]:
+                del self.waiters[key]
+        return self.snapshots.get(key)
+
+    async def poll(self):
+        try:
+            while self.waiters:
+                await asyncio.sleep(self.interval)
+                keys = list(self.waiters)
+                # connection of shared thread is never closed by end of request,
+                # so broken and expired connections are dropped on every cycle
+                await run_shared(close_old_connections)
+                try:
+                    snapshots = await run_shared(self.fetch, keys)
+                except Exception:
+                    logger.exception('Polling of %s failed', self.fetch.__name__)
+                    continue
+                for key in keys:
+                    snapshot = snapshots.get(key)
+                    if snapshot != self.snapshots.get(key):
+                        self.snapshots[key] = snapshot
+                        for event in self.waiters.get(key, ()):
+                            event.set()
+                # states of objects nobody waits for are not kept
+                for key in set(self.snapshots) - set(self.waiters):
+                    del self.snapshots[key]
+        finally:
+            self.task = None
+
+
+status_watcher = Watcher(get_status_snapshots, settings.GRADING_STATUS_POLL_INTERVAL)
+
+
+async def stream_status(completion_id: int, snapshot: dict):
+    """Server-sent events of completion: `answer` for every graded code answer, `graded` with score at the end
+
+    `error` is sent at the end instead when completion couldn't be graded.
+    Stream is closed after `GRADING_STATUS_STREAM_TIMEOUT` seconds, client reconnects then.
+    """
+    sent = set()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.GRADING_STATUS_STREAM_TIMEOUT
+    while True:
+        for answer in snapshot['answers']:
+            if answer['answer'] not in sent:
+                sent.add(answer['answer'])
+                yield format_event('answer', answer)
+        if snapshot['status'] == 'graded':
+            yield format_event('graded', {'completion': completion_id, 'score': snapshot['score']})
+            return
+        if snapshot['status'] == 'error':
+            yield format_event('error', {'completion': completion_id})
+            return
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        new_snapshot = await status_watcher.wait(
+            completion_id, snapshot, min(settings.GRADING_STATUS_TIMEOUT, remaining)
+        )
+        if new_snapshot is None:
+            return
+        if new_snapshot == snapshot:
+            # comment keeps proxies from closing idle connection
+            yield ': ping\n\n'
+        snapshot = new_snapshot
+
+
+def encode_cursor(cursor: tuple[int, int] | None) -> str:
+    if cursor is None:
+        return ''
+    change_xid, pk = cursor
+    return base64.urlsafe_b64encode(f'{change_xid}|{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, int] | None:
+    """Position of completion in feed, raises ValueError for malformed cursor"""
+    if not cursor:
+        return None
+    change_xid, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return int(change_xid), int(pk)
+
+
+def get_feed_completions(test):
+    """Completions of test that feed can show, i.e. changed by transactions older than any running one
+
+    Completions are ordered by id of transaction that changed them, which is assigned when it starts
+    writing, not when it commits. Transaction that is still running may commit changes behind ones
+    already shown, so changes after the oldest running transaction wait until it ends.
+    """
+    horizon = RawSQL('pg_snapshot_xmin(pg_current_snapshot())::text::bigint', [], output_field=BigIntegerField())
+    return Completion.objects.filter(test=test, change_xid__lt=horizon)
+
+
+def get_feed_heads(test_ids) -> dict[int, dict]:
+    """Last change of feed of every test, one row of (test, change_xid, id) index for each test"""
+    last = get_feed_completions(OuterRef('pk')).order_by('-change_xid', '-id')
+    tests = Test.objects.filter(pk__in=test_ids).annotate(
+        last=Subquery(last.values('pk')[:1]), last_change_xid=Subquery(last.values('change_xid')[:1])
+    )
+    return {
+        test_id: {'last': last_id, 'change_xid': change_xid}
+        for test_id, last_id, change_xid in tests.values_list('pk', 'last', 'last_change_xid')
+    }
+
+
+def get_feed_page(test_id: int, cursor: tuple[int, int] | None, limit: int) -> list[tuple[tuple[int, int], dict]]:
+    """Completions of test changed after cursor in order of change with their cursors, projected to fields shown in feed
+
+    Completion comes again when it's graded or rescored, with the same `id`. Rows are read
+    by range of (test, change_xid, id) index, so cost depends only on number of changed rows.
+    """
+    completions = get_feed_completions(test_id)
+    if cursor is not None:
+        change_xid, pk = cursor
+        completions = completions.filter(Q(change_xid__gt=change_xid) | Q(change_xid=change_xid, pk__gt=pk))
+    rows = completions.order_by('change_xid', 'id').values(
+        'id', 'user', 'user__first_name', 'user__last_name', 'score', 'status', 'created_at', 'updated_at',
+        'change_xid',
+    )[:limit]
+    # same names as in completion serializer
+    return [
+        (
+            (row['change_xid'], row['id']),
+            {
+                'id': row['id'],
+                'user': {'id': row['user'], 'first_name': row['user__first_name'], 'last_name': row['user__last_name']},
+                'score': row['score'],
+                'status': row['status'],
+                'created_at': row['created_at'],
+                'updated_at': row['updated_at'],
+            },
+        )
+        for row in rows
+    ]
+
+
+def get_feed_end(test_id: int) -> tuple[int, int] | None:
+    last = get_feed_completions(test_id).order_by('-change_xid', '-id').values('id', 'change_xid').first()
+    return None if last is None else (last['change_xid'], last['id'])
+
+
+feed_watcher = Watcher(get_feed_heads, settings.COMPLETION_FEED_POLL_INTERVAL)
+
+
+async def stream_feed(test_id: int, cursor: tuple[int, int] | None):
+    """Server-sent `completion` event for every new or changed completion of test, `id` of event is its cursor
+
+    Stream is closed after `GRADING_STATUS_STREAM_TIMEOUT` seconds, client reconnects then
+    with `Last-Event-ID` or `cursor` parameter.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.GRADING_STATUS_STREAM_TIMEOUT
+    head = await feed_watcher.get(test_id)
+    while head is not None:
+        page = await run_shared(get_feed_page, test_id, cursor, settings.COMPLETION_FEED_PAGE_SIZE)
+        for cursor, completion in page:
+            yield f'id: {encode_cursor(cursor)}\n' + format_event('completion', completion)
+        if len(page) == settings.COMPLETION_FEED_PAGE_SIZE:
+            continue
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        new_head = await feed_watcher.wait(test_id, head, min(settings.GRADING_STATUS_TIMEOUT, remaining))
+        if new_head == head:
+            # comment keeps proxies from closing idle connection
+            yield ': ping\n\n'
+        head = new_head
@@ -0,0 +1,370 @@
+import datetime as dt
+import logging
+import math
+import time
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from organizations.models import Organization
+from questions.models import CodeBody
+
+from .admission import reject
+from .cache import result_cache
+from .models import RESULT_FIELDS, Answer, CodeAnswerBody, Completion, GradingJob, GradingShare
+from .scoring import score_completions, update_answer_points, update_scores
+from .utils import DEFAULT_LIMITS, check_codes, get_jobs, run_jobs
+
+logger = logging.getLogger(__name__)
+
+
+def check_grading_backlog() -> None:
+    """Rejects submission with code answers when grading queue is longer than allowed, regrades aren't counted"""
+    if not settings.GRADING_MAX_BACKLOG:
+        return
+    if GradingJob.objects.filter(status='pending', priority__lt=GradingJob.REGRADE).count() > settings.GRADING_MAX_BACKLOG:
+        raise reject()
+
+
+def submit_for_grading(completion: Completion, priority: int = GradingJob.LIVE) -> None:
+    """Grades completion right away or puts it in grading queue if it has code answers"""
+    if any(answer.question.type == 'code' for answer in completion.answers.all()):  # type: ignore
+        if completion.status != 'pending':
+            completion.status = 'pending'
+            completion.save(update_fields=['status', 'updated_at'])
+        GradingJob.objects.create(
+            completion=completion, priority=priority, organization_id=completion.user.organization_id
+        )
+        return
+    completion.status = 'graded'
+    save_score(completion)
+
+
+def save_score(completion: Completion) -> None:
+    completion.score = score_completions([completion])[completion.pk]
+    completion.is_score_stale = False
+    completion.save(update_fields=['score', 'status', 'is_score_stale', 'updated_at'])
+    Answer.objects.bulk_update(completion.answers.all(), ['points'])  # type: ignore
+
+
+def rescore_stale(batch_size: int) -> int:
+    """Recomputes outdated scores of graded completions, returns number of rescored completions
+
+    Verdicts of code answers may be of old testing code, so completions with code answers
+    are put in grading queue to run them again instead, their job saves the score.
+    Rows are locked while scores are computed, so answer key change made meanwhile
+    marks them stale again after this transaction.
+    """
+    with transaction.atomic():
+        completions = list(
+            Completion.objects.select_for_update(skip_locked=True)
+            .filter(is_score_stale=True, status='graded')
+            .order_by('pk')[:batch_size]
+        )
+        with_code = set(
+            Answer.objects.filter(completion__in=completions, question__type='code').values_list('completion', flat=True)
+        )
+        queue_regrade(Completion.objects.filter(pk__in=with_code))
+        Completion.objects.filter(pk__in=with_code).update(is_score_stale=False)
+        save_scores([completion for completion in completions if completion.pk not in with_code])
+    return len(completions)
+
+
+def queue_regrade(completions) -> int:
+    """Puts graded completions of queryset in grading queue in regrade priority class
+
+    Completions already waiting for regrade are skipped. Returns number of queued completions.
+    """
+    queued = GradingJob.objects.filter(status='pending', priority=GradingJob.REGRADE).values('completion')
+    completions = (
+        completions.filter(status='graded')
+        .exclude(pk__in=queued)
+        .values_list('pk', 'user__organization')
+        .distinct()
+    )
+    jobs = GradingJob.objects.bulk_create(
+        GradingJob(completion_id=completion_id, priority=GradingJob.REGRADE, organization_id=organization_id)
+        for completion_id, organization_id in completions.iterator()
+    )
+    return len(jobs)
+
+
+def save_scores(completions: list[Completion]) -> None:
+    """Recomputes and saves scores of completions and points of their answers"""
+    scores = score_completions(completions)
+    now = timezone.now()
+    for completion in completions:
+        completion.score = scores[completion.pk]
+        completion.is_score_stale = False
+        completion.updated_at = now
+    Completion.objects.bulk_update(completions, ['score', 'is_score_stale', 'updated_at'])
+    Answer.objects.bulk_update(
+        [answer for completion in completions for answer in completion.answers.all()],  # type: ignore
+        ['points'],
+    )
+
+
+def rescore_questions(question_ids, batch_size: int) -> int:
+    """Rescores graded completions after answer key of questions is changed
+
+    Only answers to the questions are recomputed, then scores are summed from stored points,
+    both with one UPDATE per batch of completions. Returns number of rescored completions.
+    Outdated scores are left to `rescore_stale`, their answers may have no stored points.
+    """
+    completion_ids = list(
+        Completion.objects.filter(
+            answers__question__in=question_ids, status='graded', is_score_stale=False
+        ).order_by('pk').values_list('pk', flat=True).distinct()
+    )
+    for start in range(0, len(completion_ids), batch_size):
+        batch = completion_ids[start:start + batch_size]
+        with transaction.atomic():
+            update_answer_points(Answer.objects.filter(completion__in=batch, question__in=question_ids))
+            update_scores(Completion.objects.filter(pk__in=batch))
+    return len(completion_ids)
+
+
+def calibrate_limits(code_body: CodeBody) -> dict:
+    """Runs reference solution of question and derives sandbox limits from resources it used
+
+    Returns fields of code body to update.
+    """
+    jobs = get_jobs(code_body.reference_solution, code_body, DEFAULT_LIMITS)
+    results = run_jobs(jobs * settings.SANDBOX_CALIBRATION_RUNS)
+    if not results:
+        return {'calibration_status': 'failed', 'calibration_error': 'question has no cases'}
+    failed = next((result for result in results if not result['is_correct']), None)
+    if failed is not None:
+        return {
+            'calibration_status': 'failed',
+            'calibration_error': failed['errors'] or failed['exit_reason'],
+        }
+    factor = settings.SANDBOX_LIMIT_FACTOR
+    wall_time_factor = factor * settings.SANDBOX_WALL_TIME_HEADROOM
+    cpu_time = max(result['cpu_time'] for result in results)
+    wall_time = max(result['wall_time'] for result in results)
+    memory = max(result['max_memory'] for result in results)
+    return {
+        'calibration_status': 'done',
+        'calibration_error': '',
+        # cpu time limit of sandbox is in whole seconds
+        'cpu_time_limit': min(max(math.ceil(cpu_time * factor), settings.SANDBOX_MIN_CPU_TIME), DEFAULT_LIMITS.cpu_time),
+        'wall_time_limit': min(
+            max(wall_time * wall_time_factor, settings.SANDBOX_MIN_WALL_TIME), DEFAULT_LIMITS.wall_time
+        ),
+        'memory_limit': min(max(int(memory * factor), settings.SANDBOX_MIN_MEMORY), DEFAULT_LIMITS.memory),
+    }
+
+
+def calibrate_pending() -> bool:
+    """Calibrates limits of one question waiting for it, returns False when there is no such question
+
+    Question is not locked while reference solution runs, so limits are saved only
+    if reference solution and the way it's checked are still the same.
+    """
+    code_body = CodeBody.objects.filter(calibration_status='pending').order_by('pk').first()
+    if code_body is None:
+        return False
+    CodeBody.objects.filter(
+        pk=code_body.pk,
+        calibration_status='pending',
+        reference_solution=code_body.reference_solution,
+        grading_mode=code_body.grading_mode,
+        testing_code=code_body.testing_code,
+        io_cases=code_body.io_cases,
+    ).update(**calibrate_limits(code_body))
+    return True
+
+
+def get_turns(jobs, window_started_at: dt.datetime) -> list[int | None]:
+    """Organizations that have jobs in queryset in order of their turn, None stands for jobs without organization
+
+    Turn goes to organization that started the fewest jobs in its fair share window.
+    Every organization is checked by its own index lookup, so cost doesn't depend on length of queue.
+    """
+    shares = GradingShare.objects.filter(window_started_at__gte=window_started_at)
+    organizations = (
+        Organization.objects.filter(Exists(jobs.filter(organization=OuterRef('pk'))))
+        .annotate(recent_runs=Coalesce(Subquery(shares.filter(organization=OuterRef('pk')).values('runs')), 0))
+        .values_list('recent_runs', 'pk')
+    )
+    turns = list(organizations)
+    if jobs.filter(organization=None).exists():
+        turns.append((shares.filter(organization=None).values_list('runs', flat=True).first() or 0, None))
+    return [organization_id for _, organization_id in sorted(turns, key=lambda turn: (turn[0], turn[1] or 0))]
+
+
+def count_run(organization_id: int | None, now: dt.datetime, window_started_at: dt.datetime) -> None:
+    """Adds started job to share of organization, share starts new window when its window is over"""
+    share, _ = GradingShare.objects.get_or_create(organization_id=organization_id)
+    is_in_window = Q(window_started_at__gte=window_started_at)
+    GradingShare.objects.filter(pk=share.pk).update(
+        runs=Case(When(is_in_window, then=F('runs') + 1), default=1),
+        window_started_at=Case(When(is_in_window, then=F('window_started_at')), default=Value(now)),
+    )
+
+
+def claim_job() -> GradingJob | None:
+    """Takes next job from queue
+
+    Job of the highest priority class is taken, within class it's job of organization
+    that started the fewest jobs in its `GRADING_FAIR_SHARE_WINDOW` seconds window, so bulk
+    work of one organization doesn't hold jobs of others. Oldest of its jobs is taken.
+    Jobs that were running longer than `GRADING_JOB_LEASE` seconds are considered
+    abandoned by crashed worker and can be claimed again. Job given back to queue
+    waits `GRADING_RETRY_DELAY` seconds after its last start.
+    """
+    now = timezone.now()
+    lease_expired_at = now - dt.timedelta(seconds=settings.GRADING_JOB_LEASE)
+    retry_at = now - dt.timedelta(seconds=settings.GRADING_RETRY_DELAY)
+    window_started_at = now - dt.timedelta(seconds=settings.GRADING_FAIR_SHARE_WINDOW)
+    claimable = GradingJob.objects.filter(
+        Q(status='pending', started_at__isnull=True)
+        | Q(status='pending', started_at__lt=retry_at)
+        | Q(
+            status='running',
+            started_at__lt=lease_expired_at,
+            attempts__lt=settings.GRADING_JOB_MAX_ATTEMPTS,
+        )
+    )
+    with transaction.atomic():
+        job = None
+        for priority in (GradingJob.LIVE, GradingJob.INTERACTIVE, GradingJob.REGRADE):
+            jobs = claimable.filter(priority=priority)
+            for organization_id in get_turns(jobs, window_started_at):
+                job = (
+                    jobs.filter(organization=organization_id)
+                    .select_for_update(skip_locked=True)
+                    .order_by('created_at')
+                    .first()
+                )
+                if job is not None:
+                    break
+            if job is not None:
+                break
+        if job is None:
+            return None
+        job.status = 'running'
+        job.started_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'attempts'])
+        count_run(job.organization_id, now, window_started_at)
+    return job
+
+
+class ContendedTimeout(Exception):
+    """Code answers ran out of wall time waiting for busy sandbox, they are run again later"""
+
+
+def is_contended_timeout(result: dict) -> bool:
+    return result['is_timed_out'] and result['cpu_time'] < result['wall_time'] * settings.GRADING_CONTENDED_CPU_SHARE
+
+
+def grade_completion(
+    completion: Completion, regrade: bool = False, priority: int = GradingJob.LIVE, final: bool = True
+) -> None:
+    """Runs all not graded code answers of completion and stores score
+
+    Graded answers are run again too when completion is regraded.
+    Sandbox slot is taken in priority class of job. Unless attempt is `final`,
+    answers with contended timeout are left not graded and `ContendedTimeout` is raised.
+    """
+    code_bodies = CodeAnswerBody.objects.filter(answer__completion=completion)
+    if not regrade:
+        code_bodies = code_bodies.filter(is_correct__isnull=True)
+    code_bodies = list(code_bodies.select_related('answer__question__codebody'))
+    # all code answers are run in one sandbox session in parallel
+    checks = [(body.code, body.answer.question.codebody) for body in code_bodies]  # type: ignore
+    results = check_codes(checks, priority=priority)
+    graded = []
+    for body, result in zip(code_bodies, results):
+        if not final and is_contended_timeout(result):
+            continue
+        body.set_result(result)
+        graded.append(body)
+    CodeAnswerBody.objects.bulk_update(graded, RESULT_FIELDS)
+    if len(graded) < len(code_bodies):
+        raise ContendedTimeout(f'{len(code_bodies) - len(graded)} code answers timed out in busy sandbox')
+    completion.status = 'graded'
+    save_score(completion)
+
+
+def fail_completions(completion_ids) -> None:
+    """Marks completions that couldn't be graded, regraded completions keep their old score"""
+    Completion.objects.filter(pk__in=completion_ids, status='pending').update(status='error', updated_at=timezone.now())
+
+
+def process_job(job: GradingJob) -> None:
+    """Grades completion of job and stores job outcome"""
+    is_last_attempt = job.attempts >= settings.GRADING_JOB_MAX_ATTEMPTS
+    try:
+        grade_completion(
+            job.completion, regrade=job.priority == GradingJob.REGRADE, priority=job.priority, final=is_last_attempt
+        )
+    except ContendedTimeout as error:
+        logger.info('Grading job %s is retried: %s', job.pk, error)
+        job.error = str(error)
+        job.status = 'pending'
+    except Exception:
+        logger.exception('Grading job %s failed', job.pk)
+        job.error = traceback.format_exc()
+        # give job back to queue until it runs out of attempts
+        job.status = 'failed' if is_last_attempt else 'pending'
+    else:
+        job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    if job.status == 'failed':
+        fail_completions([job.completion_id])  # type: ignore
+
+
+def fail_abandoned_jobs() -> int:
+    """Fails jobs whose lease expired after their last attempt, returns number of failed jobs
+
+    Worker that crashed on last attempt doesn't finish such job, and it can't be claimed again.
+    """
+    lease_expired_at = timezone.now() - dt.timedelta(seconds=settings.GRADING_JOB_LEASE)
+    with transaction.atomic():
+        jobs = list(
+            GradingJob.objects.select_for_update(skip_locked=True)
+            .filter(status='running', started_at__lt=lease_expired_at, attempts__gte=settings.GRADING_JOB_MAX_ATTEMPTS)
+            .values_list('pk', 'completion')
+        )
+        if not jobs:
+            return 0
+        GradingJob.objects.filter(pk__in=[pk for pk, _ in jobs]).update(
+            status='failed', error='lease expired on last attempt', finished_at=timezone.now()
+        )
+        fail_completions([completion_id for _, completion_id in jobs])
+    return len(jobs)
+
+
+def run_worker(poll_interval: float, once: bool = False) -> None:
+    """Calibrates limits of questions, processes jobs from queue and rescores outdated scores
+
+    Sleeps `poll_interval` seconds when there is nothing to do.
+    """
+    processed = 0
+    while True:
+        # answers are graded with limits of question, so they are calibrated first
+        if calibrate_pending():
+            continue
+        fail_abandoned_jobs()
+        job = claim_job()
+        if job is not None:
+            process_job(job)
+            processed += 1
+            continue
+        if processed:
+            logger.info('Queue is empty after %s jobs, sandbox result cache: %s', processed, result_cache.stats())
+            processed = 0
+        # stale scores are recomputed only when there is nothing to grade
+        if rescore_stale(settings.GRADING_RESCORE_BATCH_SIZE):
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from completions.cache import result_cache
+from completions.grading import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Grades code answers of submitted completions from grading queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.GRADING_WORKER_POLL_INTERVAL,
+            help='Seconds to wait before checking empty queue again',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when queue is empty instead of waiting for new jobs',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Grading worker started')
+        try:
+            run_worker(options['poll_interval'], once=options['once'])
+        except KeyboardInterrupt:
+            self.stdout.write('Grading worker stopped')
+        stats = result_cache.stats()
+        self.stdout.write(
+            'Sandbox result cache: {hits} hits, {misses} misses, {entries} entries'.format(**stats)
+        )
@@ -0,0 +1,83 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from completions.models import RegradeRun
+from completions.regrade import Regrader, enqueue_regrade, start_run
+from questions.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Runs code answers to questions again with current testing code and updates scores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--question', type=int, action='append', default=[], help='Code question to regrade')
+        parser.add_argument('--test', type=int, action='append', default=[], help='Test to regrade all code questions of')
+        parser.add_argument('--resume', type=int, metavar='RUN_ID', help='Continue interrupted regrade run')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.REGRADE_PROCESSES,
+            help='Number of processes running code',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.REGRADE_BATCH_SIZE,
+            help='Answers regraded between checkpoints',
+        )
+        parser.add_argument('--max-rate', type=float, default=0, help='Maximum sandbox runs per second, 0 for no limit')
+        parser.add_argument(
+            '--max-backlog',
+            type=int,
+            default=0,
+            help='Pause while grading queue has more pending jobs than this',
+        )
+        parser.add_argument('--nice', type=int, default=10, help='Niceness of processes running code')
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            help='Put completions in grading queue as regrade jobs instead of running code here',
+        )
+
+    def handle(self, *args, **options):
+        if options['resume'] is not None:
+            run = RegradeRun.objects.filter(pk=options['resume']).first()
+            if run is None:
+                raise CommandError(f'Regrade run {options["resume"]} does not exist')
+            if run.status == 'done':
+                raise CommandError(f'Regrade run {run.pk} is already done')
+        else:
+            question_ids = list(
+                Question.objects.filter(Q(pk__in=options['question']) | Q(test__in=options['test']), type='code')
+                .values_list('pk', flat=True)
+            )
+            if not question_ids:
+                raise CommandError('No code questions to regrade, use --question or --test')
+            if options['queue']:
+                self.stdout.write(f'Queued {enqueue_regrade(question_ids)} completions for regrade')
+                return
+            run = start_run(question_ids)
+        self.stdout.write(f'Regrade run {run.pk}: {run.processed} of {run.total} answers are regraded')
+
+        regrader = Regrader(
+            run,
+            processes=options['processes'],
+            batch_size=options['batch_size'],
+            max_rate=options['max_rate'],
+            max_backlog=options['max_backlog'],
+            poll_interval=settings.GRADING_WORKER_POLL_INTERVAL,
+            niceness=options['nice'],
+        )
+        started_at = time.monotonic()
+        try:
+            regrader.regrade()
+        except KeyboardInterrupt:
+            self.stdout.write(f'Regrade stopped, continue it with --resume {run.pk}')
+        report = regrader.report(time.monotonic() - started_at)
+        self.stdout.write(
+            'Regraded {answers} answers with {runs} runs in {elapsed:.1f} s: '
+            '{runs_per_second:.1f} runs/sec, p95 run time {p95:.3f} s'.format(**report)
+        )
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_existing_graded(apps, schema_editor):
+    # completions created before grading queue were graded on first read
+    Completion = apps.get_model('completions', 'Completion')
+    Completion.objects.update(status='graded')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0004_completion_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completion',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('graded', 'graded')], default='pending', max_length=10, verbose_name='grading status'),
+        ),
+        migrations.RunPython(mark_existing_graded, reverse_code=migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='GradingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=10, verbose_name='job status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='grading attempts')),
+                ('error', models.TextField(blank=True, verbose_name='last grading error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('completion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grading_jobs', to='completions.completion')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='completions_status_f821d4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_existing_stale(apps, schema_editor):
+    # scores were recomputed on every read before, stored ones may be outdated
+    Completion = apps.get_model('completions', 'Completion')
+    Completion.objects.update(is_score_stale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0005_grading_queue'),
+        ('questions', '0019_alter_question_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completion',
+            name='is_score_stale',
+            field=models.BooleanField(default=False, verbose_name='is score outdated'),
+        ),
+        migrations.RunPython(mark_existing_stale, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='completion',
+            index=models.Index(condition=models.Q(('is_score_stale', True)), fields=['is_score_stale'], name='completion_stale_score_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0006_completion_is_score_stale'),
+        ('questions', '0020_test_content_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='completion',
+            index=models.Index(fields=['test', 'created_at', 'id'], name='completion_test_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completion',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='completion_user_created_idx'),
+        ),
+    ]
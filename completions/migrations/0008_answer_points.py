@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+def mark_graded_stale(apps, schema_editor):
+    # points of existing answers are stored when grading worker rescores them
+    Completion = apps.get_model('completions', 'Completion')
+    Completion.objects.filter(status='graded').update(is_score_stale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0007_completion_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='points',
+            field=models.FloatField(blank=True, null=True, verbose_name='points'),
+        ),
+        migrations.RunPython(mark_graded_stale, reverse_code=migrations.RunPython.noop),
+    ]
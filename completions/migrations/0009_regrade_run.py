@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0008_answer_points'),
+        ('questions', '0020_test_content_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegradeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'running'), ('done', 'done')], default='running', max_length=10, verbose_name='regrade status')),
+                ('last_body_id', models.PositiveBigIntegerField(default=0, verbose_name='last regraded answer body')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='answers to regrade')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='regraded answers')),
+                ('runs', models.PositiveIntegerField(default=0, verbose_name='sandbox runs')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('questions', models.ManyToManyField(to='questions.question')),
+            ],
+        ),
+    ]
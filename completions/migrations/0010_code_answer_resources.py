@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0009_regrade_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codeanswerbody',
+            name='cpu_time',
+            field=models.FloatField(blank=True, null=True, verbose_name='cpu time, seconds'),
+        ),
+        migrations.AddField(
+            model_name='codeanswerbody',
+            name='exit_reason',
+            field=models.CharField(blank=True, choices=[('ok', 'ok'), ('exit', 'exit'), ('exception', 'exception'), ('timeout', 'timeout'), ('cpu_limit', 'cpu_limit'), ('memory_limit', 'memory_limit'), ('signal', 'signal')], max_length=20, verbose_name='exit reason'),
+        ),
+        migrations.AddField(
+            model_name='codeanswerbody',
+            name='max_memory',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='peak memory, bytes'),
+        ),
+        migrations.AddField(
+            model_name='codeanswerbody',
+            name='wall_time',
+            field=models.FloatField(blank=True, null=True, verbose_name='wall time, seconds'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0010_code_answer_resources'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='codeanswerbody',
+            name='exit_reason',
+            field=models.CharField(blank=True, choices=[('ok', 'ok'), ('exit', 'exit'), ('exception', 'exception'), ('timeout', 'timeout'), ('cpu_limit', 'cpu_limit'), ('memory_limit', 'memory_limit'), ('signal', 'signal'), ('syntax_error', 'syntax_error'), ('disallowed', 'disallowed')], max_length=20, verbose_name='exit reason'),
+        ),
+    ]
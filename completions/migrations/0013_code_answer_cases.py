@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0012_exit_reason_output_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codeanswerbody',
+            name='passed_cases',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='passed cases'),
+        ),
+        migrations.AddField(
+            model_name='codeanswerbody',
+            name='total_cases',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='total cases'),
+        ),
+        migrations.AlterField(
+            model_name='codeanswerbody',
+            name='exit_reason',
+            field=models.CharField(blank=True, choices=[('ok', 'ok'), ('exit', 'exit'), ('exception', 'exception'), ('timeout', 'timeout'), ('cpu_limit', 'cpu_limit'), ('memory_limit', 'memory_limit'), ('output_limit', 'output_limit'), ('wrong_output', 'wrong_output'), ('signal', 'signal'), ('syntax_error', 'syntax_error'), ('disallowed', 'disallowed')], max_length=20, verbose_name='exit reason'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0013_code_answer_cases'),
+        ('organizations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='gradingjob',
+            name='completions_status_f821d4_idx',
+        ),
+        migrations.AddField(
+            model_name='gradingjob',
+            name='organization',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='grading_jobs', to='organizations.organization'),
+        ),
+        migrations.AddField(
+            model_name='gradingjob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'live'), (1, 'interactive'), (2, 'regrade')], default=0, verbose_name='priority class'),
+        ),
+        migrations.AddIndex(
+            model_name='gradingjob',
+            index=models.Index(fields=['status', 'priority', 'created_at'], name='grading_job_claim_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gradingjob',
+            index=models.Index(fields=['organization', 'started_at'], name='grading_job_org_started_idx'),
+        ),
+    ]
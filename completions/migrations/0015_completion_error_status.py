@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0014_grading_job_priority'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='completion',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('graded', 'graded'), ('error', 'error')], default='pending', max_length=10, verbose_name='grading status'),
+        ),
+    ]
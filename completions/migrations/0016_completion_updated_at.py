@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_updated_at(apps, schema_editor):
+    # existing completions are not changed since they were created as far as feed is concerned
+    Completion = apps.get_model('completions', 'Completion')
+    Completion.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0015_completion_error_status'),
+        ('questions', '0022_codebody_io_cases'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completion',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(set_updated_at, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='completion',
+            index=models.Index(fields=['test', 'updated_at', 'id'], name='completion_test_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+# id of transaction is assigned to row on every write, so feed can tell which changes
+# can't appear behind it anymore: ones of transactions older than oldest running one
+SET_CHANGE_XID = """
+CREATE FUNCTION completions_completion_set_change_xid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER completions_completion_change_xid
+    BEFORE INSERT OR UPDATE ON completions_completion
+    FOR EACH ROW EXECUTE FUNCTION completions_completion_set_change_xid();
+"""
+DROP_CHANGE_XID = """
+DROP TRIGGER completions_completion_change_xid ON completions_completion;
+DROP FUNCTION completions_completion_set_change_xid();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0016_completion_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completion',
+            name='change_xid',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(SET_CHANGE_XID, reverse_sql=DROP_CHANGE_XID),
+        migrations.RemoveIndex(
+            model_name='completion',
+            name='completion_test_updated_idx',
+        ),
+        migrations.AddIndex(
+            model_name='completion',
+            index=models.Index(fields=['test', 'change_xid', 'id'], name='completion_test_change_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('completions', '0017_completion_change_xid'),
+        ('organizations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingShare',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('runs', models.PositiveIntegerField(default=0, verbose_name='started jobs')),
+                ('window_started_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='gradingjob',
+            name='grading_job_org_started_idx',
+        ),
+        migrations.AddIndex(
+            model_name='gradingjob',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'running'])), fields=['organization', 'priority', 'created_at'], name='grading_job_org_queue_idx'),
+        ),
+        migrations.AddField(
+            model_name='gradingshare',
+            name='organization',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='grading_shares', to='organizations.organization'),
+        ),
+        migrations.AddConstraint(
+            model_name='gradingshare',
+            constraint=models.UniqueConstraint(fields=('organization',), name='grading_share_org_unique', nulls_distinct=False),
+        ),
+    ]
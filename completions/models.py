@@ -1,54 +1,82 @@
 from django.db import models
-from .utils import run_code
+from django.utils.translation import gettext_lazy as _
 
 
 class Completion(models.Model):
     user = models.ForeignKey('users.User', on_delete=models.CASCADE)
     test = models.ForeignKey('questions.Test', on_delete=models.CASCADE)
     score = models.PositiveSmallIntegerField(null=True)
+    status = models.CharField(
+        _('grading status'),
+        max_length=10,
+        choices=(
+            ('pending', 'pending'),
+            ('graded', 'graded'),
+            # grading job ran out of attempts
+            ('error', 'error'),
+        ),
+        default='pending',
+    )
+    # answer key of test was changed after score was stored
+    is_score_stale = models.BooleanField(_('is score outdated'), default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # changed with status and score, bulk updates have to set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+    # transaction that inserted or changed completion last, set by database trigger
+    change_xid = models.BigIntegerField(default=0, editable=False)
 
-    def get_score(self) -> int:
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_score_stale'], condition=models.Q(is_score_stale=True), name='completion_stale_score_idx'),
+            # cursor pagination of completion listings
+            models.Index(fields=['test', 'created_at', 'id'], name='completion_test_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='completion_user_created_idx'),
+            # live feed of new and graded completions of test
+            models.Index(fields=['test', 'change_xid', 'id'], name='completion_test_change_idx'),
+        ]
+
+    def compute_score(self) -> int:
+        """Sums points of answers, uses prefetched answers if they are loaded
+
+        Points are also set to `points` of answers, so they can be saved along with score.
+        """
         user_score = 0
         for answer in self.answers.all():   # type: ignore
-            user_score += answer.get_points()
-        self.score = user_score
-        self.save()
-        return self.score
+            answer.points = answer.get_points()
+            user_score += answer.points
+        return round(user_score)
 
 
 class Answer(models.Model):
     completion = models.ForeignKey(Completion, on_delete=models.CASCADE, related_name='answers')
     question = models.ForeignKey('questions.Question', on_delete=models.CASCADE)
+    # points of graded answer, kept to rescore completions when answer key of some questions is changed
+    points = models.FloatField(_('points'), null=True, blank=True)
 
     @property
     def body(self):
         return getattr(self, self.question.type + 'answerbody')
 
     def get_points(self):
+        """Computes points in memory, see `completions.scoring` for prefetching of used relations"""
         match self.question.type:
             case 'text' | 'radio':
                 return self.question.points * self.body.picked_variant.is_correct
             case 'check':
+                picked_variants = self.body.picked_variants.all()
+                picked_correct_count = sum(variant.is_correct for variant in picked_variants)
                 if self.question.body.strict_score:
-                    return (
-                        self.body.picked_variants.filter(is_correct=True).count()
-                        == self.question.body.variants.filter(is_correct=True).count()
-                    ) * self.question.points
+                    correct_count = sum(variant.is_correct for variant in self.question.body.variants.all())
+                    return (picked_correct_count == correct_count) * self.question.points
                 else:
-                    return (
-                        self.body.picked_variants.filter(is_correct=True).count()
-                        / self.body.picked_variants.all().count()
-                    ) * self.question.points
+                    if not picked_variants:
+                        return 0
+                    return picked_correct_count / len(picked_variants) * self.question.points
             case 'code':
-                if self.body.is_correct is None:
-                    run_result = run_code(
-                        self.body.code + '\n' * 2 + self.question.body.testing_code
-                    )
-                    self.body.is_correct = run_result['is_correct']
-                    self.body.errors = run_result['errors']
-                    self.body.save()
-                return self.body.is_correct * self.question.points
+                # code answers are graded by grading worker, not graded yet answer gives no points
+                if self.body.total_cases:
+                    return self.body.passed_cases / self.body.total_cases * self.question.points
+                return bool(self.body.is_correct) * self.question.points
 
 
 class AbstractAnswerBody(models.Model):
@@ -70,7 +98,141 @@ class CheckAnswerBody(AbstractAnswerBody):
     picked_variants = models.ManyToManyField('questions.Variant')
 
 
+# fields of code answer that are set from sandbox run result
+RESULT_FIELDS = [
+    'is_correct', 'errors', 'cpu_time', 'wall_time', 'max_memory', 'exit_reason', 'passed_cases', 'total_cases',
+]
+
+
 class CodeAnswerBody(AbstractAnswerBody):
     code = models.TextField()
     is_correct = models.BooleanField(null=True)
     errors = models.TextField(null=True, blank=True)
+    # resources used by sandbox run, same code shares results of one run
+    cpu_time = models.FloatField(_('cpu time, seconds'), null=True, blank=True)
+    wall_time = models.FloatField(_('wall time, seconds'), null=True, blank=True)
+    max_memory = models.PositiveBigIntegerField(_('peak memory, bytes'), null=True, blank=True)
+    exit_reason = models.CharField(
+        _('exit reason'),
+        max_length=20,
+        choices=(
+            ('ok', 'ok'),
+            ('exit', 'exit'),
+            ('exception', 'exception'),
+            ('timeout', 'timeout'),
+            ('cpu_limit', 'cpu_limit'),
+            ('memory_limit', 'memory_limit'),
+            ('output_limit', 'output_limit'),
+            ('wrong_output', 'wrong_output'),
+            ('signal', 'signal'),
+            ('syntax_error', 'syntax_error'),
+            ('disallowed', 'disallowed'),
+        ),
+        blank=True,
+    )
+    # cases of question in `io` grading mode, null in `tests` mode
+    passed_cases = models.PositiveIntegerField(_('passed cases'), null=True, blank=True)
+    total_cases = models.PositiveIntegerField(_('total cases'), null=True, blank=True)
+
+    def set_result(self, run_result: dict):
+        self.is_correct = run_result['is_correct']
+        self.errors = run_result['errors']
+        for field in RESULT_FIELDS[2:]:
+            setattr(self, field, run_result[field])
+
+
+class GradingJob(models.Model):
+    """Queued grading of code answers of completion
+
+    Jobs are processed by `grading_worker` management command, jobs of higher
+    priority class first, organizations within class get fair share of workers.
+    """
+
+    LIVE = 0
+    INTERACTIVE = 1
+    REGRADE = 2
+
+    completion = models.ForeignKey(Completion, on_delete=models.CASCADE, related_name='grading_jobs')
+    priority = models.PositiveSmallIntegerField(
+        _('priority class'),
+        choices=(
+            (LIVE, 'live'),
+            (INTERACTIVE, 'interactive'),
+            (REGRADE, 'regrade'),
+        ),
+        default=LIVE,
+    )
+    organization = models.ForeignKey(
+        'organizations.Organization', on_delete=models.SET_NULL, null=True, related_name='grading_jobs'
+    )
+    status = models.CharField(
+        _('job status'),
+        max_length=10,
+        choices=(
+            ('pending', 'pending'),
+            ('running', 'running'),
+            ('done', 'done'),
+            ('failed', 'failed'),
+        ),
+        default='pending',
+    )
+    attempts = models.PositiveSmallIntegerField(_('grading attempts'), default=0)
+    error = models.TextField(_('last grading error'), blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'priority', 'created_at'], name='grading_job_claim_idx'),
+            # oldest job of organization that has its turn
+            models.Index(
+                fields=['organization', 'priority', 'created_at'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='grading_job_org_queue_idx',
+            ),
+        ]
+
+
+class GradingShare(models.Model):
+    """Jobs that organization started in its current fair share window, updated when job is claimed
+
+    Jobs of users without organization are counted by their own share with no organization.
+    """
+
+    organization = models.ForeignKey(
+        'organizations.Organization', on_delete=models.CASCADE, null=True, related_name='grading_shares'
+    )
+    runs = models.PositiveIntegerField(_('started jobs'), default=0)
+    window_started_at = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization'], nulls_distinct=False, name='grading_share_org_unique'),
+        ]
+
+
+class RegradeRun(models.Model):
+    """Progress of regrading of code answers to questions
+
+    Answers are regraded in order of id by `regrade` management command,
+    which can continue interrupted run from the last processed answer.
+    """
+
+    questions = models.ManyToManyField('questions.Question')
+    status = models.CharField(
+        _('regrade status'),
+        max_length=10,
+        choices=(
+            ('running', 'running'),
+            ('done', 'done'),
+        ),
+        default='running',
+    )
+    last_body_id = models.PositiveBigIntegerField(_('last regraded answer body'), default=0)
+    total = models.PositiveIntegerField(_('answers to regrade'), default=0)
+    processed = models.PositiveIntegerField(_('regraded answers'), default=0)
+    runs = models.PositiveIntegerField(_('sandbox runs'), default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True)
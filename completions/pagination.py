@@ -0,0 +1,40 @@
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .scoring import prefetch_for_scoring
+
+
+class CompletionCursorPagination(CursorPagination):
+    """Newest completions first, backed by (test|user, created_at, id) indexes"""
+
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+COMPLETION_LIST_PARAMETERS = [
+    OpenApiParameter('cursor', str, description='Cursor from next or previous link'),
+    OpenApiParameter('page_size', int, description='Number of completions on page, at most 100'),
+    OpenApiParameter(
+        'fields', str, description='Comma separated fields to return, e.g. `id,user,score` to skip answers'
+    ),
+]
+
+
+def get_paginated_completions(request, view, completions, serializer_class) -> Response:
+    """Returns page of completions with fields requested in `fields` query parameter"""
+    fields = None
+    if fields_param := request.query_params.get('fields'):
+        fields = fields_param.split(',')
+        unknown_fields = set(fields) - set(serializer_class.Meta.fields)
+        if unknown_fields:
+            raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown_fields))}'})
+    if fields is None or 'answers' in fields:
+        completions = prefetch_for_scoring(completions)
+    paginator = CompletionCursorPagination()
+    page = paginator.paginate_queryset(completions, request, view=view)
+    serializer = serializer_class(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
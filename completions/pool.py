@@ -0,0 +1,138 @@
+import atexit
+import json
+import math
+import selectors
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+SANDBOX_PATH = Path(__file__).resolve().parent / 'sandbox.py'
+
+
+class ZygoteError(Exception):
+    """Zygote process died or stopped answering"""
+
+
+class Zygote:
+    """Pre-started sandbox process that forks a child for every job"""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, SANDBOX_PATH],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            # environment of web process holds secret key and database credentials
+            env={},
+        )
+        self.started_at = time.monotonic()
+        self.jobs_done = 0
+
+    def run_batch(self, jobs: list[dict], parallelism: int) -> list[dict]:
+        """Sends jobs to zygote at once, zygote runs up to `parallelism` of them in parallel
+
+        See `sandbox.Job` for job format.
+        """
+        timeout = math.ceil(len(jobs) / parallelism) * max(job['timeout'] for job in jobs)
+        return self._request({'jobs': jobs, 'parallelism': parallelism}, timeout, jobs=len(jobs))
+
+    def _request(self, request: dict, timeout: float, jobs: int):
+        try:
+            self.proc.stdin.write(json.dumps(request).encode() + b'\n')  # type: ignore
+            self.proc.stdin.flush()  # type: ignore
+        except (BrokenPipeError, OSError) as e:
+            raise ZygoteError('zygote is not running') from e
+        # zygote kills job after timeout itself, extra time covers fork and output transfer
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.proc.stdout, selectors.EVENT_READ)  # type: ignore
+            if not selector.select(timeout + 5):
+                raise ZygoteError('zygote is not responding')
+        line = self.proc.stdout.readline()  # type: ignore
+        if not line:
+            raise ZygoteError('zygote exited')
+        self.jobs_done += jobs
+        return json.loads(line)
+
+    def is_expired(self) -> bool:
+        """Checks recycle policy of pool"""
+        if self.proc.poll() is not None:
+            return True
+        if self.jobs_done >= settings.SANDBOX_POOL_MAX_JOBS:
+            return True
+        return time.monotonic() - self.started_at >= settings.SANDBOX_POOL_MAX_AGE
+
+    def close(self):
+        self.proc.kill()
+        self.proc.wait()
+
+
+class SandboxPool:
+    """Pool of zygotes shared by threads of the process
+
+    Zygotes are started on demand, at most `size` of them run jobs at the same time.
+    Batch is run by one zygote, so it may use up to its parallelism cores.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle: list[Zygote] = []
+
+    def _acquire(self) -> Zygote:
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return Zygote()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, zygote: Zygote | None):
+        if zygote is not None and zygote.is_expired():
+            zygote.close()
+            zygote = None
+        if zygote is not None:
+            with self._lock:
+                self._idle.append(zygote)
+        self._slots.release()
+
+    def run_batch(self, jobs: list[dict], parallelism: int) -> list[dict]:
+        """Runs jobs in children of one zygote, see `Zygote.run_batch`"""
+        return self._call(lambda zygote: zygote.run_batch(jobs, parallelism))
+
+    def _call(self, method):
+        zygote: Zygote | None = self._acquire()
+        try:
+            return method(zygote)
+        except ZygoteError:
+            zygote.close()  # type: ignore
+            zygote = None
+            raise
+        finally:
+            self._release(zygote)
+
+    def close(self):
+        with self._lock:
+            for zygote in self._idle:
+                zygote.close()
+            self._idle.clear()
+
+
+_pool: SandboxPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    """Returns pool of current process, pool is created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(settings.SANDBOX_POOL_SIZE)
+            atexit.register(_pool.close)
+        return _pool
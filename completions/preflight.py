@@ -0,0 +1,69 @@
+import ast
+import functools
+import traceback
+
+# modules that give access to processes, files and memory of sandbox, import of them is
+# rejected early with clear message, it's not a security boundary: code can reach them
+# through sys.modules or builtins anyway, sandbox itself is what confines code
+DISALLOWED_MODULES = frozenset({
+    'os', 'posix', 'subprocess', 'ctypes', 'socket', 'shutil', 'multiprocessing',
+    'signal', 'resource', 'importlib', 'pty', 'fcntl', 'mmap',
+})
+PREFLIGHT_CACHE_SIZE = 4096
+
+
+def find_disallowed(tree: ast.AST) -> list[str]:
+    """Returns descriptions of disallowed imports and calls in code"""
+    found = []
+    for node in ast.walk(tree):
+        match node:
+            case ast.Import(names=names):
+                modules = [alias.name for alias in names]
+            case ast.ImportFrom(module=str(module), level=0):
+                modules = [module]
+            case ast.Call(func=ast.Name(id='__import__')):
+                found.append(f'line {node.lineno}: __import__ is not allowed')
+                continue
+            case _:
+                continue
+        for module in modules:
+            if module.split('.')[0] in DISALLOWED_MODULES:
+                found.append(f'line {node.lineno}: import of {module} is not allowed')
+    return found
+
+
+@functools.lru_cache(maxsize=PREFLIGHT_CACHE_SIZE)
+def preflight(code: str) -> dict | None:
+    """Checks student code without running it
+
+    Returns failed check result for code that doesn't compile or imports disallowed modules,
+    such code is not sent to sandbox. Returns None for code that has to be run.
+    Check of imports only saves sandbox runs of code that would fail anyway, it doesn't
+    make code safe to run outside of sandbox.
+    """
+    try:
+        tree = ast.parse(code, '<string>')
+        compile(tree, '<string>', 'exec')
+    except (SyntaxError, ValueError) as exc:
+        return make_result(''.join(traceback.format_exception_only(exc)), 'syntax_error')
+    except (MemoryError, RecursionError, OverflowError) as exc:
+        # deeply nested expressions exhaust parser of valid code too
+        return make_result(f'code is too complex to compile: {type(exc).__name__}\n', 'syntax_error')
+    disallowed = find_disallowed(tree)
+    if disallowed:
+        return make_result('\n'.join(disallowed) + '\n', 'disallowed')
+    return None
+
+
+def make_result(errors: str, exit_reason: str) -> dict:
+    return {
+        'is_correct': False,
+        'errors': errors,
+        'is_timed_out': False,
+        'cpu_time': None,
+        'wall_time': None,
+        'max_memory': None,
+        'exit_reason': exit_reason,
+        'passed_cases': None,
+        'total_cases': None,
+    }
@@ -0,0 +1,144 @@
+import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import transaction
+from django.utils import timezone
+
+from .grading import queue_regrade, save_scores
+from .models import RESULT_FIELDS, CodeAnswerBody, Completion, GradingJob, RegradeRun
+from .preflight import preflight
+from .regrade_process import init_process, timed_check
+from .utils import get_check_key
+
+logger = logging.getLogger(__name__)
+
+
+def get_bodies_to_regrade(run: RegradeRun):
+    return CodeAnswerBody.objects.filter(
+        answer__question__in=run.questions.all(), pk__gt=run.last_body_id
+    ).select_related('answer__question__codebody').order_by('pk')
+
+
+def wait_for_live_queue(max_backlog: int, poll_interval: float) -> None:
+    """Waits while grading queue has more pending jobs of higher priority classes than allowed"""
+    while GradingJob.objects.filter(status='pending', priority__lt=GradingJob.REGRADE).count() > max_backlog:
+        time.sleep(poll_interval)
+
+
+class Throttle:
+    """Spaces calls so there are at most `rate` of them per second, 0 means no limit"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(self.next_at, now) + self.interval
+
+
+class Regrader:
+    """Regrades code answers of run in batches and stores checkpoint after every batch"""
+
+    def __init__(self, run: RegradeRun, processes: int, batch_size: int, max_rate: float,
+                 max_backlog: int, poll_interval: float, niceness: int):
+        self.run = run
+        self.batch_size = batch_size
+        self.throttle = Throttle(max_rate)
+        self.max_backlog = max_backlog
+        self.poll_interval = poll_interval
+        # spawned processes don't share database connections of this process
+        self.executor = ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_process,
+            initargs=(niceness,),
+        )
+        self.durations: list[float] = []
+        self.answers = 0
+
+    def regrade(self):
+        with self.executor:
+            while True:
+                wait_for_live_queue(self.max_backlog, self.poll_interval)
+                bodies = list(get_bodies_to_regrade(self.run)[:self.batch_size])
+                if not bodies:
+                    break
+                self.regrade_batch(bodies)
+        self.run.status = 'done'
+        self.run.finished_at = timezone.now()
+        self.run.save(update_fields=['status', 'finished_at', 'updated_at'])
+
+    def regrade_batch(self, bodies: list[CodeAnswerBody]):
+        # same code is run once for all students that sent it
+        codes = {}
+        results = {}
+        for body in bodies:
+            code_body = body.answer.question.codebody  # type: ignore
+            body.run_key = get_check_key(body.code, code_body)
+            result = preflight(body.code)
+            if result is not None:
+                results[body.run_key] = result
+            elif body.run_key not in codes:
+                codes[body.run_key] = (body.code, code_body)
+        futures = {}
+        for key, (code, code_body) in codes.items():
+            self.throttle.wait()
+            futures[self.executor.submit(timed_check, code, code_body)] = key
+        for future in as_completed(futures):
+            results[futures[future]], duration = future.result()
+            self.durations.append(duration)
+
+        for body in bodies:
+            body.set_result(results[body.run_key])
+        with transaction.atomic():
+            CodeAnswerBody.objects.bulk_update(bodies, RESULT_FIELDS)
+            # pending completions get score from grading worker
+            completions = list(
+                Completion.objects.select_for_update()
+                .filter(pk__in={body.answer.completion_id for body in bodies}, status='graded')  # type: ignore
+                .order_by('pk')
+            )
+            save_scores(completions)
+            self.run.last_body_id = bodies[-1].pk
+            self.run.processed += len(bodies)
+            self.run.runs += len(codes)
+            self.run.save(update_fields=['last_body_id', 'processed', 'runs', 'updated_at'])
+        self.answers += len(bodies)
+        logger.info('Regrade run %s: %s of %s answers', self.run.pk, self.run.processed, self.run.total)
+
+    def report(self, elapsed: float) -> dict:
+        durations = sorted(self.durations)
+        return {
+            'answers': self.answers,
+            'runs': len(durations),
+            'elapsed': elapsed,
+            'runs_per_second': len(durations) / elapsed if elapsed else 0,
+            'p95': durations[math.ceil(len(durations) * 0.95) - 1] if durations else 0,
+        }
+
+
+def start_run(question_ids) -> RegradeRun:
+    """Creates regrade run of code answers to questions
+
+    Old results are replaced batch by batch, so scores keep old results until answer is regraded.
+    """
+    run = RegradeRun.objects.create()
+    run.questions.set(question_ids)
+    run.total = CodeAnswerBody.objects.filter(answer__question__in=question_ids).count()
+    run.save(update_fields=['total'])
+    return run
+
+
+def enqueue_regrade(question_ids) -> int:
+    """Puts completions with answers to questions in grading queue in regrade priority class
+
+    Grading worker runs their code answers again after live and interactive jobs,
+    organizations get fair share of it. Returns number of queued completions.
+    """
+    return queue_regrade(Completion.objects.filter(answers__question__in=question_ids))
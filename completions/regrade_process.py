@@ -0,0 +1,25 @@
+import os
+import time
+
+# spawned regrade process imports this module to unpickle its functions before
+# django is set up, so django and grading code are imported inside of them
+
+
+def init_process(niceness: int):
+    """Prepares regrade process, it's started by spawn and has to set up django itself"""
+    import django
+
+    django.setup()
+    os.nice(niceness)
+
+
+def timed_check(code: str, code_body) -> tuple[dict, float]:
+    """Runs code past result cache, since cached results are the ones being replaced"""
+    from .models import GradingJob
+    from .utils import combine_results, get_jobs, get_limits, run_jobs
+
+    started_at = time.perf_counter()
+    # sandbox slots go to live and interactive checks first
+    results = run_jobs(get_jobs(code, code_body, get_limits(code_body)), priority=GradingJob.REGRADE)
+    result = combine_results(results, code_body.grading_mode)
+    return result, time.perf_counter() - started_at
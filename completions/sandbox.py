@@ -1,14 +1,41 @@
-import sys
+import _thread
+import gc
+import io
+import json
+import os
 import resource
+import selectors
+import signal
+import socket
+import struct
+import sys
+import time
+import traceback
+
 import pyseccomp as seccomp
 
 
 MEMORY_LIMIT = 1024 * 1024 * 1024  # 1 mb
 CPU_TIME_LIMIT = 11  # 3 sec
 WRITE_LIMIT = 0  # 0 bytes
+OUTPUT_LIMIT = 64 * 1024  # bytes of stdout and stderr together
+# exit statuses child reports outcome of code with, only main thread of child can exit with success
+OK_EXIT_CODE = 0
+EXCEPTION_EXIT_CODE = 1
+MEMORY_ERROR_EXIT_CODE = 2
+SYSTEM_EXIT_EXIT_CODE = 3
+EXIT_REASONS = {
+    EXCEPTION_EXIT_CODE: 'exception',
+    MEMORY_ERROR_EXIT_CODE: 'memory_limit',
+    SYSTEM_EXIT_EXIT_CODE: 'exit',
+}
+# child gets SIGXCPU at cpu time limit and SIGKILL a second later if it survives,
+# cpu time measured after kill may be a bit less than limit the kernel checked
+CPU_TIME_KILL_DELAY = 1
+CPU_TIME_TOLERANCE = 0.05
 
 
-def drop_perms():
+def drop_perms(syscalls=()):
     # respond with EPERM: operation not permitted so users can tell
     # they're being blocked from doing something
     filter = seccomp.SyscallFilter(seccomp.ERRNO(seccomp.errno.EPERM))
@@ -20,22 +47,452 @@ def drop_perms():
     filter.add_rule(
         seccomp.ALLOW, "write", seccomp.Arg(0, seccomp.EQ, sys.stderr.fileno())
     )
+    # allow reading input of job from stdin
+    filter.add_rule(
+        seccomp.ALLOW, "read", seccomp.Arg(0, seccomp.EQ, sys.stdin.fileno())
+    )
+    # allow allocating memory, amount of it is limited by RLIMIT_AS,
+    # otherwise large input and data segfault
+    for syscall in ("brk", "mmap", "munmap", "mremap", "madvise"):
+        filter.add_rule(seccomp.ALLOW, syscall)
+    # allow exiting, otherwise process crashes on exit and exit code is lost
+    filter.add_rule(seccomp.ALLOW, "exit_group")
+    filter.add_rule(seccomp.ALLOW, "exit")
+    # allow threads of child to wait for each other and for interpreter lock
+    filter.add_rule(seccomp.ALLOW, "futex")
+    # allow other syscalls calling thread needs
+    for syscall in syscalls:
+        filter.add_rule(seccomp.ALLOW, syscall)
 
     # load the filter in the kernel
     filter.load()
 
 
-def set_mem_limit():
+def forbid_success_exit():
+    """Kills process when calling thread exits it with status of success, filter is of calling thread only"""
+    filter = seccomp.SyscallFilter(seccomp.ALLOW)
+    # only low byte of status is seen by parent
+    filter.add_rule(seccomp.KILL_PROCESS, "exit_group", seccomp.Arg(0, seccomp.MASKED_EQ, 0xff, OK_EXIT_CODE))
+    filter.load()
+
+
+def set_mem_limit(memory_limit=MEMORY_LIMIT, cpu_time_limit=CPU_TIME_LIMIT):
     # virtual memory
-    resource.setrlimit(resource.RLIMIT_AS, (MEMORY_LIMIT, MEMORY_LIMIT))
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
     # cpu time
-    resource.setrlimit(resource.RLIMIT_CPU, (CPU_TIME_LIMIT, CPU_TIME_LIMIT))
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_time_limit, cpu_time_limit + CPU_TIME_KILL_DELAY))
     # write limit i.e. don't allow an infinite stream to stdout/stderr
     resource.setrlimit(resource.RLIMIT_FSIZE, (WRITE_LIMIT, WRITE_LIMIT))
 
 
+def get_memory_usage() -> tuple[int, int]:
+    """Address space size and resident memory of this process in bytes"""
+    with open('/proc/self/statm') as file:
+        size, resident = file.read().split()[:2]
+    return int(size) * resource.getpagesize(), int(resident) * resource.getpagesize()
+
+
+def run_child(code, stdin_fd, stdout_fd, stderr_fd, memory_limit, cpu_time_limit):
+    """Runs code in forked child, never returns
+
+    Outcome of code is reported only by exit status. Code runs in its own thread
+    whose seccomp filter kills the process when it exits with status of success,
+    so code can't report success itself. Main thread exits with it only after thread
+    of code returned from `run_code`, i.e. after code ran to the end, and runs no code
+    of user meanwhile: it only waits, with names it uses taken to locals beforehand.
+    """
+    os.dup2(stdin_fd, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+    # don't leak control pipes of zygote to user code
+    os.closerange(3, 1024)
+    # stdin of zygote is buffered with its control messages, code gets its own input
+    sys.stdin = io.TextIOWrapper(io.BufferedReader(io.FileIO(0, 'r', closefd=False)))
+    exit_process, access, exists, sched_yield = os._exit, os.access, os.F_OK, os.sched_yield
+    try:
+        # compiled before limits, since large code needs memory to compile
+        code = compile(code, '<string>', 'exec')
+        # interrupt of main thread would raise in it
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        ready = _thread.allocate_lock()
+        go = _thread.allocate_lock()
+        ready.acquire()
+        go.acquire()
+        thread = []
+        _thread.start_new_thread(run_code, (code, thread, ready, go))
+        ready.acquire()
+        sentinel, task_path = thread
+        # stack of thread of code is allocated already, limit is of memory code takes on top of it
+        set_mem_limit(get_memory_usage()[0] + memory_limit, cpu_time_limit)
+        drop_perms(("access", "faccessat", "faccessat2", "sched_yield"))
+        # tracing would let code change locals and lines of `run_code`
+        del sys.settrace, sys.setprofile
+        # native calls would let code end its thread without running to the end
+        for name in [name for name in sys.modules if name.split('.')[0] in ('ctypes', '_ctypes', 'pyseccomp')]:
+            vars(sys.modules.pop(name)).clear()
+        gc.collect()
+    except BaseException:
+        traceback.print_exc()
+        exit_process(EXCEPTION_EXIT_CODE)
+    go.release()
+    sentinel.acquire()
+    # sentinel is released just before thread exits, code may also release it itself
+    while access(task_path, exists):
+        sched_yield()
+    exit_process(OK_EXIT_CODE)
+
+
+def run_code(code, thread, ready, go):
+    """Runs code in thread of child, returns only when code ran to the end
+
+    Process is exited with status of failure otherwise. Names of outcome are taken
+    to locals before code runs, so code can't change them.
+    """
+    exit_process, exit_code = os._exit, EXCEPTION_EXIT_CODE
+    memory_error_exit_code, system_exit_exit_code = MEMORY_ERROR_EXIT_CODE, SYSTEM_EXIT_EXIT_CODE
+    try:
+        thread += [_thread._set_sentinel(), f'/proc/self/task/{_thread.get_native_id()}']
+        # loaded first, filter that drops perms forbids loading filters
+        forbid_success_exit()
+        drop_perms()
+        ready.release()
+        go.acquire()
+        exec(code, {'__name__': '__main__', '__builtins__': __builtins__})
+        sys.stdout.flush()
+        sys.stderr.flush()
+        exit_code = None
+    except SystemExit as exc:
+        exit_code = system_exit_exit_code
+        # same as interpreter does: only non integer exit codes are printed
+        if exc.code is not None and not isinstance(exc.code, int):
+            print(exc.code, file=sys.stderr)
+    except MemoryError:
+        exit_code = memory_error_exit_code
+        # memory can't be allocated to print traceback, so error is written as is
+        os.write(2, b'MemoryError\n')
+    except BaseException as exc:
+        # traceback starts at code, frame of harness isn't shown
+        traceback.print_exception(type(exc), exc, exc.__traceback__.tb_next)
+    finally:
+        if exit_code is not None:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                exit_process(exit_code)
+
+
+def send_message(sock, message: dict, fds=()):
+    data = json.dumps(message).encode()
+    socket.send_fds(sock, [struct.pack('!I', len(data))], fds)
+    sock.sendall(data)
+
+
+def receive_exactly(sock, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('socket is closed')
+        data += chunk
+    return bytes(data)
+
+
+def receive_message(sock) -> tuple[dict, list[int]]:
+    header, fds, _, _ = socket.recv_fds(sock, 4, 3)
+    if not header:
+        raise EOFError('socket is closed')
+    header += receive_exactly(sock, 4 - len(header))
+    (size,) = struct.unpack('!I', header)
+    return json.loads(receive_exactly(sock, size)), fds
+
+
+def serve_spawner(sock):
+    """Spawner mode: forks child for every `spawn` message and reaps it on `wait` message, never returns"""
+    # control pipes of zygote are not read or written by spawner
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    while True:
+        try:
+            request, fds = receive_message(sock)
+        except EOFError:
+            os._exit(0)
+        if 'wait' in request:
+            _, status, usage = os.wait4(request['wait'], 0)
+            send_message(sock, {
+                'returncode': os.waitstatus_to_exitcode(status),
+                'cpu_time': usage.ru_utime + usage.ru_stime,
+                # kilobytes on linux
+                'max_memory': usage.ru_maxrss * 1024,
+            })
+            continue
+        # child inherits memory of spawner, usage is of memory code takes on top of it
+        base_memory = get_memory_usage()[1]
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            stdin_fd, stdout_fd, stderr_fd = fds
+            run_child(
+                request['code'], stdin_fd, stdout_fd, stderr_fd,
+                request['memory_limit'], request['cpu_time_limit'],
+            )
+        for fd in fds:
+            os.close(fd)
+        send_message(sock, {'pid': pid, 'base_memory': base_memory})
+
+
+class Spawner:
+    """Process that forks children of jobs, it's started by zygote before zygote gets any job
+
+    Children are forked from spawner rather than zygote, so memory they inherit
+    holds nothing of other jobs or expected output of their own job. Spawner gets
+    only code and limits of job and descriptors of its pipes, children are reaped
+    by spawner on request, so their pids aren't reused while zygote may kill them.
+    """
+
+    def __init__(self):
+        sock, spawner_sock = socket.socketpair()
+        self.pid = os.fork()
+        if self.pid == 0:
+            sock.close()
+            serve_spawner(spawner_sock)
+        spawner_sock.close()
+        self.sock = sock
+
+    def spawn(self, request: dict, fds) -> dict:
+        send_message(self.sock, request, fds)
+        return receive_message(self.sock)[0]
+
+    def wait(self, pid: int) -> dict:
+        send_message(self.sock, {'wait': pid})
+        return receive_message(self.sock)[0]
+
+
+_spawner: Spawner | None = None
+
+
+def get_spawner() -> Spawner:
+    global _spawner
+    if _spawner is None:
+        _spawner = Spawner()
+    return _spawner
+
+
+class Job:
+    """Running child of spawner and output collected from it
+
+    Job is described by dict with `code`, `timeout` in seconds and optional
+    `memory_limit` in bytes, `cpu_time_limit` in seconds, `output_limit` in bytes,
+    `stdin` text fed to code and `expected_output` text stdout is compared with.
+    Expected output stays in zygote, child gets only code and limits.
+    """
+
+    def __init__(self, job):
+        timeout = job['timeout']
+        self.cpu_time_limit = job.get('cpu_time_limit') or CPU_TIME_LIMIT
+        self.output_limit = job.get('output_limit') or OUTPUT_LIMIT
+        expected_output = job.get('expected_output')
+        self.expected_output = None if expected_output is None else expected_output.encode()
+        self.input = memoryview((job.get('stdin') or '').encode())
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        spawned = get_spawner().spawn(
+            {
+                'code': job['code'],
+                'memory_limit': job.get('memory_limit') or MEMORY_LIMIT,
+                'cpu_time_limit': self.cpu_time_limit,
+            },
+            [stdin_r, stdout_w, stderr_w],
+        )
+        self.pid = spawned['pid']
+        self.base_memory = spawned['base_memory']
+        for fd in (stdin_r, stdout_w, stderr_w):
+            os.close(fd)
+        # input is written as child reads it, so large input doesn't block zygote
+        os.set_blocking(stdin_w, False)
+        self.stdin_fd = stdin_w
+        self.stdout_fd = stdout_r
+        self.stderr_fd = stderr_r
+        self.output = {stdout_r: bytearray(), stderr_r: bytearray()}
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout
+        self.is_timed_out = False
+        # reason child is killed before it finishes: output_limit or wrong_output
+        self.stop_reason = None
+
+    @property
+    def fds(self):
+        return (self.stdout_fd, self.stderr_fd)
+
+    def write(self) -> bool:
+        """Writes part of input, returns False when input is written or child doesn't read it"""
+        try:
+            written = os.write(self.stdin_fd, self.input[:65536])
+        except BrokenPipeError:
+            written = len(self.input)
+        self.input = self.input[written:]
+        return bool(self.input)
+
+    def close_stdin(self):
+        if self.stdin_fd is not None:
+            os.close(self.stdin_fd)
+            self.stdin_fd = None
+
+    def read(self, fd) -> bool:
+        """Reads available output, returns False when pipe is closed or child has to be stopped"""
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return False
+        start = len(self.output[fd])
+        self.output[fd] += chunk
+        written = len(self.output[self.stdout_fd]) + len(self.output[self.stderr_fd])
+        if written > self.output_limit:
+            self.stop_reason = 'output_limit'
+            del self.output[fd][len(self.output[fd]) - (written - self.output_limit):]
+            return False
+        if fd == self.stdout_fd and not self.matches_expected(start, chunk):
+            self.stop_reason = 'wrong_output'
+            return False
+        return True
+
+    def matches_expected(self, start: int, chunk: bytes) -> bool:
+        """Compares chunk of stdout written at `start` with expected output
+
+        Output may only differ from expected output by trailing whitespace,
+        so first byte that differs stops the check.
+        """
+        if self.expected_output is None:
+            return True
+        expected = self.expected_output[start:start + len(chunk)]
+        return chunk.startswith(expected) and not chunk[len(expected):].strip()
+
+    def finish(self):
+        """Closes pipes and waits for child, child is killed if it hit a limit
+
+        Resources used by child are taken from its rusage reported by spawner.
+        """
+        if self.is_timed_out or self.stop_reason:
+            os.kill(self.pid, signal.SIGKILL)
+        self.close_stdin()
+        for fd in self.fds:
+            os.close(fd)
+        usage = get_spawner().wait(self.pid)
+        returncode = usage['returncode']
+        cpu_time = usage['cpu_time']
+        return {
+            'stdout': self.output[self.stdout_fd].decode(errors='replace'),
+            'stderr': self.output[self.stderr_fd].decode(errors='replace'),
+            'is_timed_out': self.is_timed_out,
+            'returncode': returncode,
+            'cpu_time': cpu_time,
+            'wall_time': time.monotonic() - self.started_at,
+            'max_memory': max(usage['max_memory'] - self.base_memory, 0),
+            'exit_reason': self.get_exit_reason(returncode, cpu_time),
+        }
+
+    def get_exit_reason(self, returncode, cpu_time):
+        if self.is_timed_out:
+            return 'timeout'
+        if self.stop_reason:
+            return self.stop_reason
+        if returncode == -signal.SIGXCPU or (
+            returncode == -signal.SIGKILL and cpu_time >= self.cpu_time_limit - CPU_TIME_TOLERANCE
+        ):
+            return 'cpu_limit'
+        if returncode == -signal.SIGSYS:
+            # seccomp filter killed code that tried to exit with status of success
+            return 'exit'
+        if returncode < 0:
+            return 'signal'
+        if returncode != OK_EXIT_CODE:
+            # code that exits by itself doesn't run testing code to the end
+            return EXIT_REASONS.get(returncode, 'exit')
+        if self.expected_output is not None:
+            # output that is a prefix of expected output is checked only at the end
+            missing = self.expected_output[len(self.output[self.stdout_fd]):]
+            if missing.strip():
+                return 'wrong_output'
+        return 'ok'
+
+
+def run_jobs(jobs, parallelism):
+    """Runs every job in its own forked child, at most `parallelism` children at once
+
+    Every child is killed when it doesn't finish in its timeout after its start,
+    writes more than its output limit or writes output that differs from expected.
+    Results are returned in order of jobs.
+    """
+    results = [None] * len(jobs)
+    pending = list(enumerate(jobs))[::-1]
+    running = {}
+    selector = selectors.DefaultSelector()
+    while pending or running:
+        while pending and len(running) < max(parallelism, 1):
+            index, job = pending.pop()
+            job = Job(job)
+            running[index] = job
+            for fd in job.fds:
+                selector.register(fd, selectors.EVENT_READ, index)
+            if job.input:
+                selector.register(job.stdin_fd, selectors.EVENT_WRITE, index)
+            else:
+                job.close_stdin()
+        remaining = min(job.deadline for job in running.values()) - time.monotonic()
+        for key, _ in selector.select(max(remaining, 0)):
+            job = running[key.data]
+            if job.stop_reason:
+                continue
+            if key.fd == job.stdin_fd:
+                if not job.write():
+                    selector.unregister(key.fd)
+                    job.close_stdin()
+            elif not job.read(key.fd):
+                selector.unregister(key.fd)
+        now = time.monotonic()
+        for index, job in list(running.items()):
+            registered = [fd for fd in job.fds if fd in selector.get_map()]
+            if registered and (job.stop_reason or now >= job.deadline):
+                job.is_timed_out = not job.stop_reason
+                for fd in registered:
+                    selector.unregister(fd)
+            elif registered:
+                continue
+            if job.stdin_fd is not None and job.stdin_fd in selector.get_map():
+                selector.unregister(job.stdin_fd)
+            results[index] = job.finish()
+            del running[index]
+    selector.close()
+    return results
+
+
+def run_job(job):
+    """Forks child that runs code of job, collects its output"""
+    return run_jobs([job], 1)[0]
+
+
+def serve():
+    """Zygote mode: reads jobs as json lines from stdin and answers with json lines
+
+    Interpreter and modules are loaded once, every job is run in a forked child,
+    so jobs don't pay for python startup. Single job is run by sending one line
+    and closing stdin.
+    Message with `jobs` is a batch, its results are returned as list in one line.
+    """
+    # spawner is forked before zygote reads any job
+    get_spawner()
+    control = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    for line in sys.stdin:
+        job = json.loads(line)
+        if 'jobs' in job:
+            result = run_jobs(job['jobs'], job['parallelism'])
+        else:
+            result = run_job(job)
+        control.write(json.dumps(result) + '\n')
+        control.flush()
+
+
 if __name__ == "__main__":
-    code = sys.argv[1]
-    set_mem_limit()
-    drop_perms()
-    exec(code)
\ No newline at end of file
+    serve()
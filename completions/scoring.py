@@ -0,0 +1,116 @@
+from typing import Iterable
+
+from django.db.models import (Case, Count, F, FloatField, IntegerField, OuterRef,
+                              Prefetch, QuerySet, Subquery, Sum, Value, When,
+                              prefetch_related_objects)
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+
+from questions.models import CheckBody
+
+from .models import Answer, CheckAnswerBody, Completion
+
+
+def answers_prefetch() -> Prefetch:
+    """Loads everything `Answer.get_points` touches: questions, bodies and variants"""
+    return Prefetch(
+        'answers',
+        queryset=Answer.objects.select_related(
+            'question__checkbody',
+            'textanswerbody__picked_variant',
+            'radioanswerbody__picked_variant',
+            'checkanswerbody',
+            'codeanswerbody',
+        ).prefetch_related(
+            'checkanswerbody__picked_variants',
+            'question__checkbody__variants',
+        ),
+    )
+
+
+def prefetch_for_scoring(queryset: QuerySet[Completion]) -> QuerySet[Completion]:
+    """Makes completions of queryset scorable without additional queries"""
+    return queryset.prefetch_related(answers_prefetch())
+
+
+def score_completions(completions: Iterable[Completion]) -> dict[int, int]:
+    """Scores completions in fixed number of queries
+
+    Returns mapping of completion id to score, completions are not saved.
+    """
+    if isinstance(completions, QuerySet):
+        completions = prefetch_for_scoring(completions)
+    else:
+        completions = list(completions)
+        prefetch_related_objects(completions, answers_prefetch())
+    return {completion.pk: completion.compute_score() for completion in completions}
+
+
+def count_subquery(queryset, count_field):
+    """Wraps queryset in subquery that returns number of its rows"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(count_field).annotate(count=Count('*')).values('count'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def annotate_points(answers: QuerySet[Answer]) -> QuerySet[Answer]:
+    """Annotates answers with `computed_points` computed by database, same as `Answer.get_points`"""
+    picked = CheckAnswerBody.picked_variants.through.objects.filter(checkanswerbody__answer=OuterRef('pk'))
+    answers = answers.annotate(
+        picked_count=count_subquery(picked, 'checkanswerbody'),
+        picked_right=count_subquery(picked.filter(variant__is_correct=True), 'checkanswerbody'),
+        right_count=count_subquery(
+            CheckBody.variants.through.objects.filter(
+                checkbody__question=OuterRef('question'), variant__is_correct=True
+            ),
+            'checkbody',
+        ),
+    )
+    points = Cast(F('question__points'), FloatField())
+    return answers.annotate(
+        computed_points=Case(
+            When(question__type='text', textanswerbody__picked_variant__is_correct=True, then=points),
+            When(question__type='radio', radioanswerbody__picked_variant__is_correct=True, then=points),
+            When(
+                question__type='code',
+                codeanswerbody__total_cases__gt=0,
+                then=points * Cast(F('codeanswerbody__passed_cases'), FloatField())
+                / Cast(F('codeanswerbody__total_cases'), FloatField()),
+            ),
+            When(question__type='code', codeanswerbody__is_correct=True, then=points),
+            When(
+                question__type='check',
+                question__checkbody__strict_score=True,
+                picked_right=F('right_count'),
+                then=points,
+            ),
+            When(
+                question__type='check',
+                question__checkbody__strict_score=False,
+                picked_count__gt=0,
+                then=points * Cast(F('picked_right'), FloatField()) / Cast(F('picked_count'), FloatField()),
+            ),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+
+def update_answer_points(answers: QuerySet[Answer]) -> int:
+    """Recomputes stored points of answers with one UPDATE"""
+    points = annotate_points(Answer.objects.filter(pk=OuterRef('pk'))).values('computed_points')
+    return answers.update(points=Subquery(points))
+
+
+def update_scores(completions: QuerySet[Completion]) -> int:
+    """Sets scores of completions to sum of stored points of their answers with one UPDATE"""
+    total = Answer.objects.filter(completion=OuterRef('pk')).order_by().values('completion').annotate(
+        total=Sum('points')
+    ).values('total')
+    # postgres rounds half to even same as python
+    score = Cast(Round(Coalesce(Subquery(total, output_field=FloatField()), Value(0.0))), IntegerField())
+    return completions.update(score=score, updated_at=timezone.now())
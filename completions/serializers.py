@@ -1,11 +1,18 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Upper
 from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_serializer
 
 from questions.serializers import VariantSerializer, VariantIsCorrectSerializer
-from questions.models import Test
+from questions.models import Test, TextBody, Variant
 from users.serializers import UserWithoutOrganizationSerializer
 
+from .grading import check_grading_backlog, submit_for_grading
 from .models import *
+from .scoring import prefetch_for_scoring
 
 class AnswerBodySerializer(serializers.Serializer):
     picked_variant = VariantIsCorrectSerializer(required=False)
@@ -28,7 +35,9 @@ class AnswerBodySerializer(serializers.Serializer):
                 return {
                     'code': instance.code,
                     'is_correct': instance.is_correct,
-                    'errors': instance.errors
+                    'errors': instance.errors,
+                    'passed_cases': instance.passed_cases,
+                    'total_cases': instance.total_cases,
                 }
             case _:
                 return {}
@@ -36,22 +45,33 @@ class AnswerBodySerializer(serializers.Serializer):
 
 class AnswerSerializer(serializers.ModelSerializer):
     body = AnswerBodySerializer()
-    points = serializers.IntegerField(read_only=True, source='get_points')
+    # stored when answer is graded and when answer key of question changes
+    points = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Answer
         fields = ('question', 'body', 'points')
 
 
+class DynamicFieldsMixin:
+    """Takes `fields` argument that limits fields of serializer"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):  # type: ignore
+                self.fields.pop(field_name)  # type: ignore
+
+
 @extend_schema_serializer()
-class CompletionSerializer(serializers.ModelSerializer):
+class CompletionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     answers = AnswerSerializer(many=True)
     user = UserWithoutOrganizationSerializer(read_only=True)
-    score = serializers.IntegerField(source='get_score', read_only=True)
+    score = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Completion
-        fields = ('id', 'user', 'test', 'answers', 'score')
+        fields = ('id', 'user', 'test', 'answers', 'score', 'status')
 
 
 class AnswerBodyCreationSerializer(serializers.Serializer):
@@ -75,74 +95,274 @@ class AnswerBodyCreationSerializer(serializers.Serializer):
                 }
             case _:
                 return {}
-    
-    def create(self, validated_data):
-        question = validated_data['answer'].question
-        match question.type:
-            case 'text':
-                variant = question.textbody.variants.filter(text__iexact=validated_data['picked_variant']['text'].rstrip().lstrip()).first()
-                if variant is None:
-                    variant = question.textbody.variants.create(text=validated_data['picked_variant']['text'], is_correct=False)
-                created_body = TextAnswerBody.objects.create(
-                    picked_variant=variant,
-                    answer=validated_data['answer']
-                )
-            case 'radio':
-                variant = question.radiobody.variants.filter(text=validated_data['picked_variant']['text']).first()
-                created_body = RadioAnswerBody.objects.create(
-                    picked_variant=variant,
-                    answer=validated_data['answer']
-                )
-            case 'check':
-                variants = question.checkbody.variants.filter(text__in=[v['text'] for v in validated_data['picked_variants']])
-                created_body = CheckAnswerBody.objects.create(
-                    answer=validated_data['answer']
-                )
-                created_body.picked_variants.set(variants)
-            case 'code':
-                created_body = CodeAnswerBody.objects.create(
-                    code=validated_data['code'],
-                    answer=validated_data['answer']
-                )
-            case _:
-                raise ValueError('Question type is not defined')
-        return created_body
 
 
 class AnswerCreationSerializer(serializers.ModelSerializer):
     body = AnswerBodyCreationSerializer()
+    question = serializers.IntegerField(source='question_id')
     
     class Meta:
         model = Answer
         fields = ('question', 'body')
-    
-    def create(self, validated_data):
-        body_data = validated_data.pop('body')
-        answer = Answer.objects.create(**validated_data)
-        body_serializer = AnswerBodyCreationSerializer(data=body_data)
-        body_serializer.is_valid(raise_exception=True)
-        body_serializer.save(answer=answer)
-        return answer
 
 
-class CompletionCreationSerializer(serializers.ModelSerializer):
+class CompletionCreationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     answers = AnswerCreationSerializer(many=True)
     test = serializers.SlugRelatedField(slug_field='public_uuid', queryset=Test.objects.all())
-    score = serializers.IntegerField(read_only=True, source='get_score')
+    score = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Completion
-        fields = ('id', 'user', 'test', 'answers', 'score')
-        read_only_fields = ('score', 'user')
+        fields = ('id', 'user', 'test', 'answers', 'score', 'status')
+        read_only_fields = ('score', 'user', 'status')
     
+    def validate(self, attrs):
+        # load all questions of test at once and check that answers are for them
+        questions = attrs['test'].questions.select_related('textbody', 'radiobody', 'checkbody')
+        questions = {question.pk: question for question in questions}
+        for answer in attrs['answers']:
+            question = questions.get(answer['question_id'])
+            if question is None:
+                raise serializers.ValidationError(f'Question {answer["question_id"]} is not in test')
+            required_field = {
+                'text': 'picked_variant',
+                'radio': 'picked_variant',
+                'check': 'picked_variants',
+                'code': 'code',
+            }[question.type]
+            if required_field not in answer['body']:
+                raise serializers.ValidationError(f'Answer to question {question.pk} must have {required_field}')
+            answer['question'] = question
+        if any(answer['question'].type == 'code' for answer in attrs['answers']):
+            check_grading_backlog()
+        return attrs
+    
+    @transaction.atomic
     def create(self, validated_data):
-        answers = validated_data.pop('answers')
+        """Creates completion with all answers in fixed number of queries"""
+        answers_data = validated_data.pop('answers')
         completion = Completion.objects.create(
             **validated_data
         )
-        for answer_data in answers:
-            answer_data['question'] = answer_data['question'].pk
-            answer_serializer = AnswerCreationSerializer(data=answer_data)
-            answer_serializer.is_valid(raise_exception=True)
-            answer_serializer.save(completion=completion)
-        return completion
\ No newline at end of file
+        variants = get_picked_variants(answers_data)
+        answers = Answer.objects.bulk_create([
+            Answer(completion=completion, question=answer_data['question'])
+            for answer_data in answers_data
+        ])
+        
+        bodies = {TextAnswerBody: [], RadioAnswerBody: [], CheckAnswerBody: [], CodeAnswerBody: []}
+        picked_variants = []
+        new_text_variants = {}
+        for answer, answer_data in zip(answers, answers_data):
+            question = answer.question
+            body_data = answer_data['body']
+            match question.type:
+                case 'text':
+                    text = body_data['picked_variant']['text']
+                    # text answers are compared case insensitive, unknown answers are saved as wrong variants
+                    variant = next(
+                        (v for v in variants[question.pk] if v.text.upper() == text.strip().upper()),
+                        None,
+                    )
+                    if variant is None:
+                        key = (question.pk, text.strip().upper())
+                        if key not in new_text_variants:
+                            new_text_variants[key] = (question, Variant(text=text, is_correct=False))
+                        variant = new_text_variants[key][1]
+                    bodies[TextAnswerBody].append(TextAnswerBody(answer=answer, picked_variant=variant))
+                case 'radio':
+                    text = body_data['picked_variant']['text']
+                    variant = next((v for v in variants[question.pk] if v.text == text), None)
+                    if variant is None:
+                        raise serializers.ValidationError(f'Question {question.pk} has no variant "{text}"')
+                    bodies[RadioAnswerBody].append(RadioAnswerBody(answer=answer, picked_variant=variant))
+                case 'check':
+                    texts = {v['text'] for v in body_data['picked_variants']}
+                    body = CheckAnswerBody(answer=answer)
+                    bodies[CheckAnswerBody].append(body)
+                    picked_variants.extend(
+                        (body, variant) for variant in variants[question.pk] if variant.text in texts
+                    )
+                case 'code':
+                    bodies[CodeAnswerBody].append(CodeAnswerBody(answer=answer, code=body_data['code']))
+        
+        if new_text_variants:
+            Variant.objects.bulk_create([variant for _, variant in new_text_variants.values()])
+            TextBody.variants.through.objects.bulk_create([
+                TextBody.variants.through(textbody_id=question.textbody.pk, variant_id=variant.pk)
+                for question, variant in new_text_variants.values()
+            ])
+        for Body, created_bodies in bodies.items():
+            if created_bodies:
+                Body.objects.bulk_create(created_bodies)
+        CheckAnswerBody.picked_variants.through.objects.bulk_create([
+            CheckAnswerBody.picked_variants.through(checkanswerbody_id=body.pk, variant_id=variant.pk)
+            for body, variant in picked_variants
+        ])
+        
+        completion = prefetch_for_scoring(Completion.objects.select_related('test').filter(pk=completion.pk)).get()
+        submit_for_grading(completion)
+        return completion
+
+
+def get_picked_variants(answers_data) -> dict[int, list[Variant]]:
+    """Loads variants that answers can pick in one query: correct variants of answered questions
+    and their variants with submitted texts
+
+    Text answers gather wrong variants with every new text, so variants are filtered by text
+    rather than loaded for whole question. Texts are compared in upper case, exact match
+    of radio and check answers is left to caller. Correct variants are loaded anyway, so
+    answer isn't taken for wrong one where database changes case differently from python.
+    """
+    question_ids = set()
+    texts = set()
+    for answer_data in answers_data:
+        body_data = answer_data['body']
+        match answer_data['question'].type:
+            case 'text':
+                texts.add(body_data['picked_variant']['text'].strip().upper())
+            case 'radio':
+                texts.add(body_data['picked_variant']['text'].upper())
+            case 'check':
+                texts.update(variant['text'].upper() for variant in body_data['picked_variants'])
+            case _:
+                continue
+        question_ids.add(answer_data['question'].pk)
+    if not question_ids:
+        return defaultdict(list)
+    variants = Variant.objects.annotate(upper_text=Upper('text')).filter(Q(upper_text__in=texts) | Q(is_correct=True))
+    return variants.group_by_question('in', question_ids)
+
+
+class QuestionStatisticsSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    type = serializers.CharField()
+    answers = serializers.IntegerField()
+    correct = serializers.IntegerField()
+    correct_rate = serializers.FloatField(allow_null=True)
+
+
+class PercentileSerializer(serializers.Serializer):
+    percentile = serializers.IntegerField()
+    score = serializers.FloatField(allow_null=True)
+
+
+class HistogramBinSerializer(serializers.Serializer):
+    score = serializers.IntegerField()
+    count = serializers.IntegerField()
+
+
+class TestStatisticsSerializer(serializers.Serializer):
+    attempts = serializers.IntegerField()
+    pending = serializers.IntegerField()
+    graded = serializers.IntegerField()
+    mean = serializers.FloatField(allow_null=True)
+    median = serializers.FloatField(allow_null=True)
+    stddev = serializers.FloatField(allow_null=True)
+    min = serializers.IntegerField(allow_null=True)
+    max = serializers.IntegerField(allow_null=True)
+    percentiles = PercentileSerializer(many=True)
+    histogram = HistogramBinSerializer(many=True)
+    questions = QuestionStatisticsSerializer(many=True)
+
+
+class VariantAnalysisSerializer(serializers.Serializer):
+    variant = serializers.IntegerField()
+    text = serializers.CharField()
+    is_correct = serializers.BooleanField()
+    count = serializers.IntegerField()
+    frequency = serializers.FloatField(allow_null=True)
+
+
+class QuestionAnalysisSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    number_in_test = serializers.IntegerField()
+    type = serializers.CharField()
+    points = serializers.IntegerField()
+    answered = serializers.IntegerField()
+    omitted = serializers.IntegerField()
+    mean_points = serializers.FloatField(allow_null=True)
+    difficulty = serializers.FloatField(allow_null=True)
+    discrimination = serializers.FloatField(allow_null=True)
+    variants = VariantAnalysisSerializer(many=True)
+
+
+class ItemAnalysisSerializer(serializers.Serializer):
+    completions = serializers.IntegerField()
+    mean_score = serializers.FloatField(allow_null=True)
+    questions = QuestionAnalysisSerializer(many=True)
+
+
+class ExitReasonCountSerializer(serializers.Serializer):
+    exit_reason = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class QuestionResourceUsageSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    cpu_time_limit = serializers.IntegerField()
+    wall_time_limit = serializers.FloatField()
+    memory_limit = serializers.IntegerField()
+    runs = serializers.IntegerField()
+    cpu_time_mean = serializers.FloatField(required=False, allow_null=True)
+    cpu_time_p95 = serializers.FloatField(required=False, allow_null=True)
+    cpu_time_max = serializers.FloatField(required=False, allow_null=True)
+    wall_time_mean = serializers.FloatField(required=False, allow_null=True)
+    wall_time_p95 = serializers.FloatField(required=False, allow_null=True)
+    wall_time_max = serializers.FloatField(required=False, allow_null=True)
+    max_memory_mean = serializers.FloatField(required=False, allow_null=True)
+    max_memory_p95 = serializers.FloatField(required=False, allow_null=True)
+    max_memory_max = serializers.IntegerField(required=False, allow_null=True)
+    exit_reasons = ExitReasonCountSerializer(many=True)
+
+
+class ResourceUsageSerializer(serializers.Serializer):
+    cpu_time_limit = serializers.IntegerField()
+    memory_limit = serializers.IntegerField()
+    run_timeout = serializers.FloatField()
+    questions = QuestionResourceUsageSerializer(many=True)
+
+
+class SandboxMetricsSerializer(serializers.Serializer):
+    slots = serializers.IntegerField()
+    slots_in_use = serializers.IntegerField()
+    queue_size = serializers.IntegerField()
+    queue_depth = serializers.IntegerField()
+    admitted = serializers.IntegerField()
+    rejected = serializers.IntegerField()
+    waited = serializers.IntegerField()
+    wait_mean = serializers.FloatField()
+    wait_max = serializers.FloatField()
+    grading_backlog = serializers.IntegerField()
+
+
+class QueueLatencySerializer(serializers.Serializer):
+    priority = serializers.CharField(required=False)
+    organization = serializers.IntegerField(required=False, allow_null=True)
+    pending = serializers.IntegerField()
+    oldest_pending = serializers.FloatField(allow_null=True)
+    started = serializers.IntegerField()
+    wait_mean = serializers.FloatField(allow_null=True)
+    wait_p95 = serializers.FloatField(allow_null=True)
+    wait_max = serializers.FloatField(allow_null=True)
+
+
+class GradingQueueSerializer(serializers.Serializer):
+    classes = QueueLatencySerializer(many=True)
+    organizations = QueueLatencySerializer(many=True)
+
+
+class DryRunSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    code = serializers.CharField()
+
+
+class DryRunResultSerializer(serializers.Serializer):
+    is_correct = serializers.BooleanField()
+    errors = serializers.CharField(allow_blank=True)
+    exit_reason = serializers.CharField()
+    passed_cases = serializers.IntegerField(allow_null=True)
+    total_cases = serializers.IntegerField(allow_null=True)
+    cpu_time = serializers.FloatField(allow_null=True)
+    wall_time = serializers.FloatField(allow_null=True)
+    max_memory = serializers.IntegerField(allow_null=True)
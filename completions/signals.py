@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.dispatch import receiver
+
+from questions.models import CheckBody, CodeBody, Question, Variant
+
+from .cache import result_cache
+from .grading import rescore_questions
+from .models import CodeAnswerBody
+from .regrade import enqueue_regrade
+
+# fields that affect points of already given answers
+ANSWER_KEY_FIELDS = {
+    Question: ('points',),
+    Variant: ('is_correct',),
+    CheckBody: ('strict_score',),
+    CodeBody: ('grading_mode', 'testing_code', 'io_cases'),
+}
+# fields of code question that reference solution is checked with
+CALIBRATION_FIELDS = ('grading_mode', 'testing_code', 'io_cases', 'reference_solution')
+
+
+def regrade_code_answers(question_ids):
+    """Runs code answers to questions again in grading queue after the way they are checked is changed
+
+    Verdicts of old testing code are cleared, so pending jobs of completions that
+    are being graded run them again too. Regraded completions keep old score until their job is done.
+    """
+    CodeAnswerBody.objects.filter(answer__question__in=question_ids).update(is_correct=None)
+    enqueue_regrade(question_ids)
+
+
+def update_scores_of_questions(sender, question_ids):
+    """Updates scores of completions that answered questions after their answer key is changed"""
+    if sender is CodeBody:
+        regrade_code_answers(question_ids)
+    else:
+        rescore_questions(question_ids, settings.ANSWER_KEY_RESCORE_BATCH_SIZE)
+
+
+def get_question_ids(instance) -> list[int]:
+    if isinstance(instance, Question):
+        return [instance.pk]
+    if isinstance(instance, Variant):
+        return [
+            *instance.text_question.values_list('question_id', flat=True),
+            *instance.radio_question.values_list('question_id', flat=True),
+            *instance.check_question.values_list('question_id', flat=True),
+        ]
+    return [instance.question_id]
+
+
+@receiver(pre_save)
+def detect_answer_key_change(sender, instance, **kwargs):
+    fields = ANSWER_KEY_FIELDS.get(sender)
+    if fields is None or instance.pk is None:
+        return
+    old_values = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._answer_key_changed = old_values is not None and any(
+        old_values[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save)
+def update_scores_on_answer_key_change(sender, instance, created, **kwargs):
+    if getattr(instance, '_answer_key_changed', False):
+        update_scores_of_questions(sender, get_question_ids(instance))
+        instance._answer_key_changed = False
+
+
+@receiver(m2m_changed, sender=CheckBody.variants.through)
+def update_scores_on_variants_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Number of correct variants of check question is used in strict scoring"""
+    # relations are already gone after clear, so questions are found before
+    if action == 'pre_clear':
+        instance._cleared_question_ids = get_check_question_ids(instance, reverse)
+    elif action == 'post_clear':
+        update_scores_of_questions(CheckBody, instance.__dict__.pop('_cleared_question_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        update_scores_of_questions(CheckBody, get_check_question_ids(instance, reverse))
+
+
+def get_check_question_ids(instance, reverse) -> list[int]:
+    if reverse:
+        return list(instance.check_question.values_list('question_id', flat=True))
+    return [instance.question_id]
+
+
+@receiver(pre_save, sender=CodeBody)
+def schedule_limits_calibration(sender, instance, **kwargs):
+    """Limits are calibrated again by grading worker when reference solution or the way it's checked is changed"""
+    old_values = None
+    if instance.pk is not None:
+        old_values = CodeBody.objects.filter(pk=instance.pk).values(*CALIBRATION_FIELDS).first()
+    if old_values == {field: getattr(instance, field) for field in CALIBRATION_FIELDS}:
+        return
+    instance.calibration_status = 'pending' if instance.reference_solution.strip() else ''
+    instance.calibration_error = ''
+    instance.cpu_time_limit = instance.wall_time_limit = instance.memory_limit = None
+
+
+@receiver(post_save, sender=CodeBody)
+def invalidate_sandbox_results(sender, instance, **kwargs):
+    """Results of old testing code are useless after question is edited"""
+    result_cache.invalidate_body(instance.pk)
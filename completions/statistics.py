@@ -0,0 +1,190 @@
+import datetime as dt
+
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import (Aggregate, Avg, Count, DurationField, ExpressionWrapper, F,
+                              FloatField, Max, Min, OuterRef, Q, StdDev)
+from django.db.models.functions import Extract
+from django.utils import timezone
+
+from questions.models import CheckBody, CodeBody, Test
+
+from .models import CheckAnswerBody, CodeAnswerBody, Completion, GradingJob, RadioAnswerBody, TextAnswerBody
+from .scoring import count_subquery
+from .utils import DEFAULT_LIMITS, get_limits
+
+PERCENTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def of_test(test: Test) -> dict:
+    """Lookups of answer bodies of completions of test, answers to questions of other tests are skipped"""
+    return {'answer__completion__test': test, 'answer__question__test': test}
+
+
+class PercentilesCont(Aggregate):
+    """Postgres percentile_cont for several fractions at once, returns list in order of fractions"""
+
+    function = 'percentile_cont'
+    template = '%(function)s(ARRAY[%(fractions)s]) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = ArrayField(FloatField())  # type: ignore
+
+    def __init__(self, expression, fractions, **extra):
+        super().__init__(expression, fractions=', '.join(str(float(f)) for f in fractions), **extra)
+
+
+def get_check_correctness(test: Test):
+    """Check answer is correct when it gives full points for question"""
+    picked = CheckAnswerBody.picked_variants.through.objects.filter(checkanswerbody=OuterRef('pk'))
+    answers = CheckAnswerBody.objects.filter(**of_test(test)).annotate(
+        picked_right=count_subquery(picked.filter(variant__is_correct=True), 'checkanswerbody'),
+        picked_wrong=count_subquery(picked.filter(variant__is_correct=False), 'checkanswerbody'),
+        right_count=count_subquery(
+            CheckBody.variants.through.objects.filter(
+                checkbody__question=OuterRef('answer__question'), variant__is_correct=True
+            ),
+            'checkbody',
+        ),
+    )
+    strict_correct = Q(answer__question__checkbody__strict_score=True, picked_right=F('right_count'))
+    lenient_correct = Q(answer__question__checkbody__strict_score=False, picked_wrong=0, picked_right__gt=0)
+    return answers.values('answer__question').annotate(
+        answers=Count('pk'),
+        correct=Count('pk', filter=strict_correct | lenient_correct),
+    )
+
+
+def get_question_statistics(test: Test) -> list[dict]:
+    """Number of answers and correct answers of every question of test"""
+    picked_variant_stats = {
+        'answers': Count('pk'),
+        'correct': Count('pk', filter=Q(picked_variant__is_correct=True)),
+    }
+    querysets = [
+        TextAnswerBody.objects.filter(**of_test(test))
+        .values('answer__question').annotate(**picked_variant_stats),
+        RadioAnswerBody.objects.filter(**of_test(test))
+        .values('answer__question').annotate(**picked_variant_stats),
+        get_check_correctness(test),
+        # not graded code answers are not counted
+        CodeAnswerBody.objects.filter(**of_test(test), is_correct__isnull=False)
+        .values('answer__question')
+        .annotate(answers=Count('pk'), correct=Count('pk', filter=Q(is_correct=True))),
+    ]
+    stats = {
+        question_id: {'question': question_id, 'type': question_type, 'answers': 0, 'correct': 0}
+        for question_id, question_type in test.questions.order_by('number_in_test').values_list('pk', 'type')  # type: ignore
+    }
+    for queryset in querysets:
+        for row in queryset.order_by():
+            stats[row['answer__question']].update(answers=row['answers'], correct=row['correct'])
+    for question_stats in stats.values():
+        answers = question_stats['answers']
+        question_stats['correct_rate'] = question_stats['correct'] / answers if answers else None
+    return list(stats.values())
+
+
+def get_test_statistics(test: Test) -> dict:
+    """Score statistics of graded completions of test, computed by database"""
+    completions = Completion.objects.filter(test=test)
+    graded = completions.filter(status='graded', score__isnull=False)
+    summary = completions.aggregate(
+        attempts=Count('pk'),
+        pending=Count('pk', filter=Q(status='pending')),
+    )
+    scores = graded.aggregate(
+        graded=Count('pk'),
+        mean=Avg('score'),
+        stddev=StdDev('score'),
+        min=Min('score'),
+        max=Max('score'),
+        percentiles=PercentilesCont('score', PERCENTILES),
+    )
+    percentiles = scores.pop('percentiles') or [None] * len(PERCENTILES)
+    histogram = graded.order_by('score').values('score').annotate(count=Count('pk'))
+    return {
+        **summary,
+        **scores,
+        'median': percentiles[PERCENTILES.index(0.5)],
+        'percentiles': [
+            {'percentile': int(fraction * 100), 'score': score}
+            for fraction, score in zip(PERCENTILES, percentiles)
+        ],
+        'histogram': list(histogram),
+        'questions': get_question_statistics(test),
+    }
+
+
+def get_resource_usage(test: Test) -> dict:
+    """Resources used by sandbox runs of code answers to every code question of test"""
+    bodies = CodeAnswerBody.objects.filter(answer__question__test=test, exit_reason__gt='')
+    usage = {}
+    for field in ('cpu_time', 'wall_time', 'max_memory'):
+        usage[f'{field}_mean'] = Avg(field)
+        usage[f'{field}_max'] = Max(field)
+        usage[f'{field}_p95'] = PercentilesCont(field, [0.95])
+    code_bodies = CodeBody.objects.filter(question__test=test).order_by('question__number_in_test')
+    questions = {}
+    for code_body in code_bodies:
+        limits = get_limits(code_body)
+        questions[code_body.question_id] = {
+            'question': code_body.question_id,
+            'cpu_time_limit': limits.cpu_time,
+            'wall_time_limit': limits.wall_time,
+            'memory_limit': limits.memory,
+            'runs': 0,
+            'exit_reasons': [],
+        }
+    for row in bodies.values('answer__question').annotate(runs=Count('pk'), **usage).order_by():
+        question_id = row.pop('answer__question')
+        for field in ('cpu_time', 'wall_time', 'max_memory'):
+            row[f'{field}_p95'] = row[f'{field}_p95'][0]
+        questions[question_id].update(row)
+    exit_reasons = bodies.values('answer__question', 'exit_reason').annotate(count=Count('pk')).order_by('-count')
+    for row in exit_reasons:
+        questions[row['answer__question']]['exit_reasons'].append(
+            {'exit_reason': row['exit_reason'], 'count': row['count']}
+        )
+    return {
+        'cpu_time_limit': DEFAULT_LIMITS.cpu_time,
+        'memory_limit': DEFAULT_LIMITS.memory,
+        'run_timeout': DEFAULT_LIMITS.wall_time,
+        'questions': list(questions.values()),
+    }
+
+
+def get_queue_latency() -> dict:
+    """Waiting of grading jobs in queue by priority class and by organization
+
+    Pending jobs are counted with age of the oldest of them, jobs started in last
+    `GRADING_METRICS_WINDOW` seconds with time they waited before start.
+    """
+    now = timezone.now()
+    wait = Extract(
+        ExpressionWrapper(F('started_at') - F('created_at'), output_field=DurationField()),
+        'epoch',
+        output_field=FloatField(),
+    )
+    pending = GradingJob.objects.filter(status='pending')
+    started = GradingJob.objects.filter(started_at__gte=now - dt.timedelta(seconds=settings.GRADING_METRICS_WINDOW))
+    priority_names = dict(GradingJob._meta.get_field('priority').choices)  # type: ignore
+    latency = {}
+    for group, field in (('classes', 'priority'), ('organizations', 'organization')):
+        rows = {}
+        empty = {'pending': 0, 'oldest_pending': None, 'started': 0, 'wait_mean': None, 'wait_p95': None, 'wait_max': None}
+        for row in pending.values(field).annotate(pending=Count('pk'), oldest=Min('created_at')).order_by():
+            rows[row[field]] = {
+                **empty,
+                field: row[field],
+                'pending': row['pending'],
+                'oldest_pending': (now - row['oldest']).total_seconds(),
+            }
+        waits = started.values(field).annotate(
+            started=Count('pk'), wait_mean=Avg(wait), wait_max=Max(wait), wait_p95=PercentilesCont(wait, [0.95])
+        )
+        for row in waits.order_by():
+            row['wait_p95'] = row['wait_p95'][0]
+            rows.setdefault(row[field], {**empty, field: row[field]}).update(row)
+        latency[group] = sorted(rows.values(), key=lambda row: (row[field] is None, row[field] or 0))
+    for row in latency['classes']:
+        row['priority'] = priority_names[row['priority']]
+    return latency
@@ -1,3 +1,427 @@
-from django.test import TestCase
+import datetime as dt
+import fcntl
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from organizations.models import Organization
+from questions.models import CodeBody, Question, RadioBody, Test, TextBody, Variant
+from users.models import User
+
+from .admission import SandboxBusy, sandbox_slot
+from .analysis import get_item_analysis, get_score_matrix
+from .dry_run import dry_run
+from .events import authenticate, get_feed_end, get_feed_heads, get_feed_page
+from .grading import claim_job, fail_abandoned_jobs, process_job, rescore_stale, save_score
+from .models import Answer, CodeAnswerBody, Completion, GradingJob
+from .preflight import preflight
+from .serializers import CompletionCreationSerializer
+from .statistics import get_test_statistics
+from .regrade import Regrader, start_run
+from .utils import DEFAULT_LIMITS, Limits, check_code, make_job, run_code, run_jobs
+
+
+class PreflightTests(SimpleTestCase):
+    def test_code_that_exhausts_parser_is_rejected(self):
+        codes = {
+            'memory': '-' * 100000 + '1',
+            'recursion': 'a' + '.b' * 200000,
+        }
+        for name, code in codes.items():
+            with self.subTest(name):
+                result = preflight(code)
+                self.assertIsNotNone(result)
+                self.assertEqual((result['is_correct'], result['exit_reason']), (False, 'syntax_error'))
+                # rejected code is not sent to sandbox
+                self.assertEqual(check_code(code, CodeBody(testing_code='assert True')), result)
+
+    def test_disallowed_import_is_rejected(self):
+        result = preflight('import os')
+        self.assertEqual(result['exit_reason'], 'disallowed')
+        self.assertIsNone(preflight('print(1)'))
+
+
+class SandboxTests(SimpleTestCase):
+    def test_code_cant_report_success_itself(self):
+        forged = 'import sys\n'
+        for fd in range(3, 10):
+            forged += f'try:\n    sys.modules["os"].write({fd}, b\'{{"status": "ok"}}\')\nexcept OSError:\n    pass\n'
+        codes = {
+            'status_fd': forged + 'sys.modules["os"]._exit(0)\nassert False',
+            'exit': 'import sys\nsys.modules["os"]._exit(0)\nassert False',
+            'system_exit': 'raise SystemExit(0)\nassert False',
+        }
+        for name, code in codes.items():
+            with self.subTest(name):
+                result = run_code(code)
+                self.assertEqual((result['is_correct'], result['exit_reason']), (False, 'exit'))
+
+    def test_code_cant_exit_with_status_of_harness(self):
+        # status harness exits with on success is looked up in frames of all threads
+        code = (
+            'import sys\n'
+            'codes = [0]\n'
+            'for frame in sys._current_frames().values():\n'
+            '    while frame is not None:\n'
+            '        codes += [v for k, v in frame.f_locals.items() if "exit" in k and type(v) is int]\n'
+            '        frame = frame.f_back\n'
+            'sys.modules["os"]._exit(codes[-1])\n'
+            'assert False'
+        )
+        for status in ('', ' + 256'):
+            with self.subTest(status=status):
+                result = run_code(code.replace('codes[-1]', 'codes[-1]' + status))
+                self.assertEqual((result['is_correct'], result['exit_reason']), (False, 'exit'))
+
+    def test_code_cant_read_expected_output(self):
+        code = (
+            'import gc, sys\n'
+            'found = []\n'
+            'frame = sys._getframe()\n'
+            'while frame is not None:\n'
+            '    found += frame.f_locals.values()\n'
+            '    frame = frame.f_back\n'
+            'for value in found + gc.get_objects():\n'
+            '    try:\n'
+            '        value = value if isinstance(value, dict) else vars(value)\n'
+            '        expected = value["expected_output"]\n'
+            '        print(expected.decode() if isinstance(expected, bytes) else expected)\n'
+            '        break\n'
+            '    except Exception:\n'
+            '        pass\n'
+        )
+        jobs = [make_job(code, DEFAULT_LIMITS, '', output) for output in ('secret 1', 'secret 2')]
+        for result in run_jobs(jobs):
+            self.assertEqual(result['exit_reason'], 'wrong_output')
+
+    def test_code_gets_no_environment_of_server(self):
+        # interpreter sets only locale it coerces C locale to
+        code = 'import sys\nassert not [name for name in sys.modules["os"].environ if name != "LC_CTYPE"]'
+        self.assertTrue(run_code(code)['is_correct'])
+
+    def test_outcome_of_code(self):
+        self.assertEqual(run_code('assert True')['exit_reason'], 'ok')
+        self.assertEqual(run_code('assert False')['exit_reason'], 'exception')
+
+    def test_cpu_limit(self):
+        limits = Limits(1, 10, DEFAULT_LIMITS.memory)
+        # kill at limit is detected every time, not only when measured cpu time reaches it
+        for result in run_jobs([make_job('while True:\n    pass', limits)] * 3):
+            self.assertEqual(result['exit_reason'], 'cpu_limit')
+
+    def test_memory_of_zygote_is_not_counted(self):
+        self.assertLess(run_code('x = 1')['max_memory'], 8 * 1024 * 1024)
+        result = run_code('x = bytearray(64 * 1024 * 1024)')
+        self.assertEqual(result['exit_reason'], 'ok')
+        self.assertLess(result['max_memory'], 80 * 1024 * 1024)
+
+
+class RegradeTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(
+            'teacher@example.com', 'password', first_name='T', last_name='T', is_teacher=True
+        )
+        self.student = User.objects.create_user('student@example.com', 'password', first_name='S', last_name='S')
+        self.test = Test.objects.create(name='test', creator=self.teacher)
+        self.question = Question.objects.create(text='code', type='code', test=self.test, number_in_test=1)
+        CodeBody.objects.create(question=self.question, testing_code='assert f() == 1')
+
+    def create_answer(self, code: str) -> CodeAnswerBody:
+        completion = Completion.objects.create(user=self.student, test=self.test, status='graded', score=0)
+        answer = Answer.objects.create(completion=completion, question=self.question)
+        return CodeAnswerBody.objects.create(answer=answer, code=code, is_correct=False, exit_reason='exception')
+
+    def test_batch_runs_in_process_pool(self):
+        right = self.create_answer('def f():\n    return 1')
+        wrong = self.create_answer('def f():\n    return 2')
+        run = start_run([self.question.pk])
+        regrader = Regrader(run, processes=1, batch_size=10, max_rate=0, max_backlog=100, poll_interval=0.1, niceness=0)
+        regrader.regrade()
+
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.processed, run.runs), ('done', 2, 2))
+        right.refresh_from_db()
+        wrong.refresh_from_db()
+        self.assertEqual((right.is_correct, right.exit_reason), (True, 'ok'))
+        self.assertEqual((wrong.is_correct, wrong.exit_reason), (False, 'exception'))
+        self.assertEqual(right.answer.completion.score, 1)
+
+
+class AnswerKeyChangeTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user('teacher@example.com', 'password', first_name='T', last_name='T')
+        student = User.objects.create_user('student@example.com', 'password', first_name='S', last_name='S')
+        test = Test.objects.create(name='test', creator=teacher)
+        question = Question.objects.create(text='code', type='code', test=test, number_in_test=1)
+        self.code_body = CodeBody.objects.create(question=question, testing_code='assert f() == 1')
+        self.completion = Completion.objects.create(user=student, test=test)
+        answer = Answer.objects.create(completion=self.completion, question=question)
+        self.body = CodeAnswerBody.objects.create(answer=answer, code='def f():\n    return 3 - 2')
+        GradingJob.objects.create(completion=self.completion)
+        process_job(claim_job())
+
+    def test_code_answers_are_run_again_with_new_testing_code(self):
+        self.body.refresh_from_db()
+        self.completion.refresh_from_db()
+        self.assertEqual((self.body.is_correct, self.completion.score), (True, 1))
+
+        self.code_body.testing_code = 'assert f() == 2'
+        self.code_body.save()
+        self.body.refresh_from_db()
+        self.assertIsNone(self.body.is_correct)
+        job = claim_job()
+        self.assertEqual(job.priority, GradingJob.REGRADE)
+        process_job(job)
+        self.body.refresh_from_db()
+        self.completion.refresh_from_db()
+        self.assertEqual((self.body.is_correct, self.completion.score), (False, 0))
+
+    def test_stale_completion_with_code_answers_is_regraded(self):
+        # testing code changed while verdicts were kept, like before answers were regraded on change
+        CodeBody.objects.filter(pk=self.code_body.pk).update(testing_code='assert f() == 2')
+        Completion.objects.filter(pk=self.completion.pk).update(is_score_stale=True)
+        self.assertEqual(rescore_stale(10), 1)
+        self.completion.refresh_from_db()
+        self.assertEqual((self.completion.score, self.completion.is_score_stale), (1, False))
+        process_job(claim_job())
+        self.completion.refresh_from_db()
+        self.assertEqual(self.completion.score, 0)
+
+
+class ScoreMatrixTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user('teacher@example.com', 'password', first_name='T', last_name='T')
+        self.student = User.objects.create_user('student@example.com', 'password', first_name='S', last_name='S')
+        self.test = Test.objects.create(name='test', creator=teacher)
+        self.question = Question.objects.create(text='code', type='code', test=self.test, number_in_test=1)
+        CodeBody.objects.create(question=self.question, testing_code='assert True')
+        self.completions = [self.create_completion(is_correct) for is_correct in (True, False, True)]
+
+    def create_completion(self, is_correct: bool) -> Completion:
+        completion = Completion.objects.create(user=self.student, test=self.test, status='graded', score=is_correct)
+        answer = Answer.objects.create(completion=completion, question=self.question)
+        CodeAnswerBody.objects.create(answer=answer, code='', is_correct=is_correct)
+        return completion
+
+    def test_answers_of_completions_not_in_matrix_are_skipped(self):
+        # completions graded after ids were read, before and after the only one in matrix
+        completion_ids = np.array([self.completions[1].pk], dtype=float)
+        scores, answered = get_score_matrix(self.test, completion_ids, np.array([self.question.pk], dtype=float))
+        self.assertEqual(scores.tolist(), [[0.0]])
+        self.assertEqual(answered.tolist(), [[True]])
+
+    def test_item_analysis(self):
+        question = get_item_analysis(self.test)['questions'][0]
+        self.assertEqual((question['answered'], question['mean_points']), (3, 2 / 3))
+
+    def test_answers_to_questions_of_other_tests_are_skipped(self):
+        other_test = Test.objects.create(name='other', creator=self.test.creator)
+        other = Question.objects.create(text='code', type='code', test=other_test, number_in_test=1)
+        CodeBody.objects.create(question=other, testing_code='assert True')
+        answer = Answer.objects.create(completion=self.completions[0], question=other)
+        CodeAnswerBody.objects.create(answer=answer, code='', is_correct=True)
+        question = get_item_analysis(self.test)['questions'][0]
+        self.assertEqual((question['answered'], question['mean_points']), (3, 2 / 3))
+        self.assertEqual(
+            [(row['question'], row['answers']) for row in get_test_statistics(self.test)['questions']],
+            [(self.question.pk, 3)],
+        )
+
+
+class AdmissionTests(SimpleTestCase):
+    def test_free_slot_is_left_to_waiting_caller_of_higher_class(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(SANDBOX_SLOTS=1, SANDBOX_SLOTS_DIR=directory):
+            # live caller that waits for slot holds shared lock of its class
+            fd = os.open(os.path.join(directory, f'waiting-{GradingJob.LIVE}'), os.O_RDWR | os.O_CREAT)
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            try:
+                with self.assertRaises(SandboxBusy):
+                    with sandbox_slot(queue_timeout=0.2, priority=GradingJob.REGRADE):
+                        pass
+                with sandbox_slot(queue_timeout=0.2, priority=GradingJob.LIVE):
+                    pass
+            finally:
+                os.close(fd)
+            with sandbox_slot(queue_timeout=0.2, priority=GradingJob.REGRADE):
+                pass
+
+
+class DryRunTests(SimpleTestCase):
+    def test_busy_sandbox_is_answered_with_retry(self):
+        code_body = CodeBody(testing_code='assert f() == 1')
+        with tempfile.TemporaryDirectory() as directory, override_settings(SANDBOX_SLOTS=1, SANDBOX_SLOTS_DIR=directory):
+            with sandbox_slot():
+                with self.assertRaises(SandboxBusy):
+                    dry_run('def f():\n    return 1', code_body)
+            self.assertTrue(dry_run('def f():\n    return 1', code_body)['is_correct'])
+
+    @override_settings(DRY_RUN_ERRORS_LIMIT=100)
+    def test_errors_are_limited(self):
+        result = dry_run('import sys\nprint("x" * 1000, file=sys.stderr)\nraise ValueError("end")', CodeBody(testing_code=''))
+        self.assertLessEqual(len(result['errors']), 110)
+        self.assertTrue(result['errors'].endswith('ValueError: end\n'))
+        self.assertNotIn('sandbox.py', result['errors'])
+
+
+class GradingJobTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user('teacher@example.com', 'password', first_name='T', last_name='T')
+        student = User.objects.create_user('student@example.com', 'password', first_name='S', last_name='S')
+        self.completion = Completion.objects.create(user=student, test=Test.objects.create(name='test', creator=teacher))
+
+    def test_completion_of_failed_job_is_marked(self):
+        job = GradingJob.objects.create(completion=self.completion, status='running', attempts=settings.GRADING_JOB_MAX_ATTEMPTS)
+        with mock.patch('completions.grading.grade_completion', side_effect=RuntimeError):
+            process_job(job)
+        self.completion.refresh_from_db()
+        self.assertEqual((job.status, self.completion.status), ('failed', 'error'))
+
+    def test_completion_of_abandoned_job_is_marked(self):
+        started_at = timezone.now() - dt.timedelta(seconds=settings.GRADING_JOB_LEASE + 1)
+        job = GradingJob.objects.create(
+            completion=self.completion, status='running', started_at=started_at, attempts=settings.GRADING_JOB_MAX_ATTEMPTS
+        )
+        self.assertEqual(fail_abandoned_jobs(), 1)
+        job.refresh_from_db()
+        self.completion.refresh_from_db()
+        self.assertEqual((job.status, self.completion.status), ('failed', 'error'))
+
+    def test_jobs_without_organization_take_turns(self):
+        organization = Organization.objects.create(name='organization', owner=self.completion.test.creator)
+        for _ in range(2):
+            GradingJob.objects.create(completion=self.completion)
+            self.assertIsNone(claim_job().organization)
+        GradingJob.objects.create(completion=self.completion)
+        job = GradingJob.objects.create(completion=self.completion, organization=organization)
+        # jobs without organization have their own share, which already started 2 jobs
+        self.assertEqual(claim_job(), job)
+        self.assertIsNone(claim_job().organization)
+
+    def test_timeout_in_busy_sandbox_is_retried(self):
+        question = Question.objects.create(text='code', type='code', test=self.completion.test, number_in_test=1)
+        CodeBody.objects.create(question=question, testing_code='assert True')
+        answer = Answer.objects.create(completion=self.completion, question=question)
+        body = CodeAnswerBody.objects.create(answer=answer, code='')
+        result = {
+            'is_correct': False, 'errors': '', 'is_timed_out': True, 'cpu_time': 0.1, 'wall_time': 2,
+            'max_memory': 0, 'exit_reason': 'timeout', 'passed_cases': None, 'total_cases': None,
+        }
+        job = GradingJob.objects.create(completion=self.completion, status='running', started_at=timezone.now(), attempts=1)
+        with mock.patch('completions.grading.check_codes', return_value=[result]):
+            process_job(job)
+            body.refresh_from_db()
+            self.assertEqual((job.status, body.is_correct), ('pending', None))
+            # job is claimed again only after delay
+            self.assertIsNone(claim_job())
+
+            job.attempts = settings.GRADING_JOB_MAX_ATTEMPTS
+            process_job(job)
+        body.refresh_from_db()
+        self.completion.refresh_from_db()
+        self.assertEqual((job.status, body.exit_reason, self.completion.status), ('done', 'timeout', 'graded'))
+
+
+class CompletionFeedTests(TransactionTestCase):
+    """Feed is ordered by transactions that changed completions, so it's tested with committed ones"""
+
+    def setUp(self):
+        teacher = User.objects.create_user('teacher@example.com', 'password', first_name='T', last_name='T')
+        self.student = User.objects.create_user('student@example.com', 'password', first_name='S', last_name='S')
+        self.test = Test.objects.create(name='test', creator=teacher)
+
+    def test_graded_completion_comes_again(self):
+        completion = Completion.objects.create(user=self.student, test=self.test)
+        cursor = get_feed_end(self.test.pk)
+        head = get_feed_heads([self.test.pk])[self.test.pk]
+        self.assertEqual(get_feed_page(self.test.pk, cursor, 10), [])
+
+        completion.status = 'graded'
+        save_score(completion)
+        self.assertNotEqual(get_feed_heads([self.test.pk])[self.test.pk], head)
+        [(item_cursor, item)] = get_feed_page(self.test.pk, cursor, 10)
+        self.assertEqual(
+            (item['id'], item['status'], item['score'], item['user']),
+            (completion.pk, 'graded', 0, {'id': self.student.pk, 'first_name': 'S', 'last_name': 'S'}),
+        )
+        self.assertEqual(get_feed_page(self.test.pk, item_cursor, 10), [])
+
+    def test_change_committed_late_is_not_skipped(self):
+        cursor = get_feed_end(self.test.pk)
+        written, commit = threading.Event(), threading.Event()
+        created = []
+
+        def create_in_long_transaction():
+            try:
+                with transaction.atomic():
+                    created.append(Completion.objects.create(user=self.student, test=self.test).pk)
+                    written.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=create_in_long_transaction)
+        thread.start()
+        self.assertTrue(written.wait(10))
+        later = Completion.objects.create(user=self.student, test=self.test)
+        # later change waits for transaction that started writing before it
+        self.assertEqual(get_feed_page(self.test.pk, cursor, 10), [])
+        commit.set()
+        thread.join()
+        page = get_feed_page(self.test.pk, cursor, 10)
+        self.assertEqual([item['id'] for _, item in page], [*created, later.pk])
+
+
+class StreamAuthenticationTests(TestCase):
+    def test_user_is_authenticated_by_api_classes(self):
+        user = User.objects.create_user('student@example.com', 'password', first_name='S', last_name='S')
+        token = str(AccessToken.for_user(user))
+        factory = RequestFactory()
+        self.assertEqual(authenticate(factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')), user)
+        self.assertIsNone(authenticate(factory.get('/', HTTP_AUTHORIZATION='Bearer invalid')))
+        # token in query would be written to access logs
+        self.assertIsNone(authenticate(factory.get('/', {'token': token})))
+
+
+class CompletionCreationTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user('teacher@example.com', 'password', first_name='T', last_name='T')
+        self.student = User.objects.create_user('student@example.com', 'password', first_name='S', last_name='S')
+        self.test = Test.objects.create(name='test', creator=teacher)
+        self.text = Question.objects.create(text='text', type='text', test=self.test, number_in_test=1)
+        self.text_body = TextBody.objects.create(question=self.text)
+        self.text_body.variants.set([
+            Variant.objects.create(text='Right', is_correct=True),
+            Variant.objects.create(text='Wrong', is_correct=False),
+        ])
+        self.radio = Question.objects.create(text='radio', type='radio', test=self.test, number_in_test=2)
+        RadioBody.objects.create(question=self.radio).variants.set([
+            Variant.objects.create(text='a', is_correct=True),
+            Variant.objects.create(text='b', is_correct=False),
+        ])
+
+    def submit(self, text: str, radio: str) -> Completion:
+        serializer = CompletionCreationSerializer(data={
+            'test': self.test.public_uuid,
+            'answers': [
+                {'question': self.text.pk, 'body': {'picked_variant': {'text': text}}},
+                {'question': self.radio.pk, 'body': {'picked_variant': {'text': radio}}},
+            ],
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.save(user=self.student)
+
+    def test_picked_variants(self):
+        self.assertEqual(self.submit(' right ', 'a').score, 2)
+        self.assertEqual(self.submit('WRONG', 'b').score, 0)
+        # unknown text answer is saved as wrong variant once
+        self.submit('other', 'b')
+        self.submit('Other ', 'b')
+        self.assertEqual(sorted(self.text_body.variants.values_list('text', flat=True)), ['Right', 'Wrong', 'other'])
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+class DryRunThrottle(BaseThrottle):
+    """Token bucket of user kept in shared cache
+
+    User can make `DRY_RUN_BURST` runs at once, bucket is refilled by `DRY_RUN_RATE` runs per minute.
+    """
+
+    def allow_request(self, request, view):
+        key = f'dry-run-bucket:{request.user.pk}'
+        rate = settings.DRY_RUN_RATE / 60
+        now = time.time()
+        tokens, updated_at = cache.get(key, (settings.DRY_RUN_BURST, now))
+        tokens = min(settings.DRY_RUN_BURST, tokens + (now - updated_at) * rate)
+        if tokens < 1:
+            self.wait_time = (1 - tokens) / rate
+            return False
+        # entry is useless after bucket is full again
+        cache.set(key, (tokens - 1, now), timeout=int(settings.DRY_RUN_BURST / rate) + 1)
+        return True
+
+    def wait(self):
+        return self.wait_time
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
 
-from .views import CompletionViewSet
+from .views import CompletionViewSet, completion_status
 
 router = SimpleRouter()
 router.register(r'', CompletionViewSet)
 
 urlpatterns = [
+    path('<int:pk>/status/', completion_status, name='completion-status'),
     path(r'', include(router.urls), name='completion')
 ]
@@ -1,20 +1,188 @@
+import json
 import subprocess
 import sys
+from typing import NamedTuple
 
-def run_code(code : str) -> dict[str, str | None | bool]:
+from django.conf import settings
+
+from .admission import sandbox_slot
+from .cache import make_key, result_cache
+from .pool import SANDBOX_PATH, ZygoteError, get_pool
+from .preflight import preflight
+from .sandbox import CPU_TIME_LIMIT, MEMORY_LIMIT
+
+RUN_TIMEOUT = 10
+
+
+class Limits(NamedTuple):
+    """Resources code is allowed to use in sandbox"""
+
+    cpu_time: int
+    wall_time: float
+    memory: int
+
+
+DEFAULT_LIMITS = Limits(CPU_TIME_LIMIT, RUN_TIMEOUT, MEMORY_LIMIT)
+
+
+def get_limits(code_body) -> Limits:
+    """Limits of question, limits that are not calibrated yet are default"""
+    return Limits(
+        code_body.cpu_time_limit or DEFAULT_LIMITS.cpu_time,
+        code_body.wall_time_limit or DEFAULT_LIMITS.wall_time,
+        code_body.memory_limit or DEFAULT_LIMITS.memory,
+    )
+
+
+def make_job(code: str, limits: Limits, stdin: str | None = None, expected_output: str | None = None) -> dict:
+    job = {
+        'code': code,
+        'timeout': limits.wall_time,
+        'cpu_time_limit': limits.cpu_time,
+        'memory_limit': limits.memory,
+        'output_limit': settings.SANDBOX_OUTPUT_LIMIT,
+    }
+    if stdin is not None:
+        job['stdin'] = stdin
+    if expected_output is not None:
+        job['expected_output'] = expected_output
+    return job
+
+
+def get_jobs(code: str, code_body, limits: Limits) -> list[dict]:
+    """Sandbox jobs that check code, one for every case of question in `io` grading mode"""
+    match code_body.grading_mode:
+        case 'io':
+            return [
+                # output of code has unix line endings, cases may be typed on windows
+                make_job(code, limits, case['input'], case['output'].replace('\r\n', '\n'))
+                for case in code_body.io_cases
+            ]
+        case _:
+            return [make_job(code + '\n' * 2 + code_body.testing_code, limits)]
+
+
+def run_in_new_process(job: dict) -> dict:
+    """Runs job in freshly started sandbox, job is sent to it through stdin"""
     proc = subprocess.Popen(
-    [sys.executable, './completions/sandbox.py', code],
-    stdout=subprocess.PIPE,
-    stderr=subprocess.PIPE,
+        [sys.executable, SANDBOX_PATH],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        # environment of web process holds secret key and database credentials
+        env={},
     )
-    is_timed_out = False
     try:
-        stdout, stderr = proc.communicate(None, timeout=10)
+        # sandbox kills job after timeout itself, extra time covers interpreter startup
+        output, _ = proc.communicate(json.dumps(job).encode() + b'\n', timeout=job['timeout'] + 5)
     except subprocess.TimeoutExpired:
-        is_timed_out = True
         proc.kill()
-        stdout, stderr = proc.communicate()
+        proc.communicate()
+        raise ZygoteError('sandbox is not responding')
+    if not output:
+        raise ZygoteError('sandbox exited')
+    return json.loads(output)
+
+
+def to_check_result(result: dict) -> dict:
     return {
-        'is_correct': (not stderr) and (not is_timed_out),
-        'errors': stderr.decode(),
+        # code is correct when it and testing code run to the end
+        'is_correct': result['exit_reason'] == 'ok',
+        'errors': result['stderr'],
+        'is_timed_out': result['is_timed_out'],
+        'cpu_time': result['cpu_time'],
+        'wall_time': result['wall_time'],
+        'max_memory': result['max_memory'],
+        'exit_reason': result['exit_reason'],
     }
+
+
+def combine_results(results: list[dict], grading_mode: str) -> dict:
+    """Makes result of answer from results of its jobs
+
+    In `io` mode answer is correct when every case is passed, errors are
+    of first failed case and resources are summed over cases.
+    """
+    if grading_mode != 'io':
+        return {**results[0], 'passed_cases': None, 'total_cases': None}
+    failed = next(((number, result) for number, result in enumerate(results, 1) if not result['is_correct']), None)
+    errors = ''
+    if failed is not None:
+        number, result = failed
+        errors = f'Case {number}: {result["exit_reason"]}\n{result["errors"]}'
+    return {
+        'is_correct': bool(results) and failed is None,
+        'errors': errors,
+        'is_timed_out': any(result['is_timed_out'] for result in results),
+        'cpu_time': sum(result['cpu_time'] for result in results),
+        'wall_time': sum(result['wall_time'] for result in results),
+        'max_memory': max((result['max_memory'] for result in results), default=0),
+        'exit_reason': failed[1]['exit_reason'] if failed else 'ok',
+        'passed_cases': sum(result['is_correct'] for result in results),
+        'total_cases': len(results),
+    }
+
+
+def run_jobs(jobs: list[dict], queue_timeout: float | None = None, priority: int = 0) -> list[dict]:
+    """Runs jobs in one sandbox session
+
+    `SANDBOX_SUBMISSION_PARALLELISM` of them are run in parallel. Session takes one of
+    host-wide sandbox slots, see `admission.sandbox_slot` for `queue_timeout` and `priority`.
+    """
+    results = None
+    with sandbox_slot(queue_timeout, priority):
+        if settings.SANDBOX_POOL_SIZE > 0:
+            try:
+                results = get_pool().run_batch(jobs, settings.SANDBOX_SUBMISSION_PARALLELISM)
+            except ZygoteError:
+                pass
+        if results is None:
+            results = [run_in_new_process(job) for job in jobs]
+    return [to_check_result(result) for result in results]
+
+
+def run_code(code: str, limits: Limits = DEFAULT_LIMITS) -> dict:
+    return run_jobs([make_job(code, limits)])[0]
+
+
+def get_check_key(code: str, code_body) -> str:
+    match code_body.grading_mode:
+        case 'io':
+            testing = 'io:' + json.dumps(code_body.io_cases, sort_keys=True)
+        case _:
+            testing = code_body.testing_code
+    return make_key(code, testing, (*get_limits(code_body), settings.SANDBOX_OUTPUT_LIMIT))
+
+
+def check_code(code: str, code_body, queue_timeout: float | None = None, priority: int = 0) -> dict:
+    """Runs code with testing code of question, same code is run only once"""
+    return check_codes([(code, code_body)], queue_timeout, priority)[0]
+
+
+def check_codes(checks: list[tuple], queue_timeout: float | None = None, priority: int = 0) -> list[dict]:
+    """Runs pairs of code and code body of question in one sandbox session
+
+    Code that fails pre-flight check isn't run, other results are taken from cache
+    when possible, same code is run only once.
+    """
+    keys = [get_check_key(code, code_body) for code, code_body in checks]
+    # code that can't be run is rejected before sandbox and cache
+    results = {key: preflight(code) or result_cache.get(key) for key, (code, _) in zip(keys, checks)}
+    to_run = {}
+    for key, (code, code_body) in zip(keys, checks):
+        if results[key] is None and key not in to_run:
+            to_run[key] = (code, code_body)
+    # jobs of all answers are run in one session, every answer takes slice of results
+    jobs = []
+    slices = {}
+    for key, (code, code_body) in to_run.items():
+        answer_jobs = get_jobs(code, code_body, get_limits(code_body))
+        slices[key] = slice(len(jobs), len(jobs) + len(answer_jobs))
+        jobs += answer_jobs
+    run_results = run_jobs(jobs, queue_timeout, priority) if jobs else []
+    for key, (_, code_body) in to_run.items():
+        result = combine_results(run_results[slices[key]], code_body.grading_mode)
+        results[key] = result
+        # timeout may be caused by load of host, so such result is not reliable
+        if not result['is_timed_out']:
+            result_cache.set(key, result, code_body.pk)
+    return [results[key] for key in keys]
@@ -1,5 +1,8 @@
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from drf_spectacular.utils import OpenApiResponse, extend_schema
-from rest_framework import generics, mixins, views, viewsets
+from rest_framework import generics, mixins, permissions, views, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
@@ -7,8 +10,13 @@ from organizations.permissions import HasOrg
 from users.permissions import IsTeacher
 from questions.permissions import CanPassTest
 
-from .models import Completion
-from .serializers import CompletionCreationSerializer, CompletionSerializer
+from .admission import get_sandbox_metrics
+from .events import authenticate, run_shared, status_watcher, stream_status
+from .models import Completion, GradingJob
+from .scoring import prefetch_for_scoring
+from .serializers import (CompletionCreationSerializer, CompletionSerializer, GradingQueueSerializer,
+                          SandboxMetricsSerializer)
+from .statistics import get_queue_latency
 
 
 class CompletionViewSet(
@@ -18,9 +26,16 @@ class CompletionViewSet(
     queryset = Completion.objects.all()
     serializer_class = CompletionCreationSerializer
 
+    def get_queryset(self):  # type: ignore
+        if self.action in ('retrieve', 'with_correctness'):
+            return prefetch_for_scoring(self.queryset.select_related('user'))
+        return super().get_queryset()
+
     def get_permissions(self):
         if self.action == 'with_correctness':
             return [HasOrg(), IsTeacher()]
+        if self.action in ('sandbox_metrics', 'grading_queue'):
+            return [permissions.IsAdminUser()]
         return [HasOrg()]
 
     def get_serializer_class(self):   # type: ignore
@@ -44,5 +59,55 @@ class CompletionViewSet(
         """Return completion with is_correct in answers."""
         return super().retrieve(request, *args, **kwargs)
 
+    @extend_schema(responses={200: SandboxMetricsSerializer})
+    @action(detail=False, methods=['GET'])
+    def sandbox_metrics(self, request, *args, **kwargs):
+        """Return usage of sandbox slots of host and length of grading queue"""
+        metrics = get_sandbox_metrics()
+        metrics['grading_backlog'] = GradingJob.objects.filter(status='pending').count()
+        return Response(SandboxMetricsSerializer(metrics).data)
+
+    @extend_schema(responses={200: GradingQueueSerializer})
+    @action(detail=False, methods=['GET'])
+    def grading_queue(self, request, *args, **kwargs):
+        """Return pending jobs and queue latency of grading by priority class and organization"""
+        return Response(GradingQueueSerializer(get_queue_latency()).data)
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+
+def can_watch(user, completion: Completion) -> bool:
+    if completion.user_id == user.pk:  # type: ignore
+        return True
+    return user.is_teacher and user.organization_id == completion.test.creator.organization_id
+
+
+@require_GET
+async def completion_status(request, pk):
+    """Grading status of completion for its student and teachers of organization, served by ASGI app
+
+    With `Accept: text/event-stream` graded answers and final score are streamed as server-sent events.
+    Otherwise it's long-poll: status is returned when completion is graded or number of graded
+    answers differs from `answers` parameter, or after `GRADING_STATUS_TIMEOUT` seconds.
+    """
+    user = await run_shared(authenticate, request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    completion = await run_shared(Completion.objects.select_related('test__creator').filter(pk=pk).first)
+    if completion is None or not can_watch(user, completion):
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    snapshot = await status_watcher.get(completion.pk)
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        return StreamingHttpResponse(
+            stream_status(completion.pk, snapshot),
+            content_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+    seen = request.GET.get('answers')
+    if seen is not None and seen.isdigit() and snapshot['status'] == 'pending' and len(snapshot['answers']) == int(seen):
+        snapshot = await status_watcher.wait(completion.pk, snapshot, settings.GRADING_STATUS_TIMEOUT)
+        if snapshot is None:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+    return JsonResponse(snapshot)
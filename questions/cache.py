@@ -0,0 +1,37 @@
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Test
+
+
+def get_public_test_payload(test: Test, build: Callable[[], dict]) -> dict:
+    """Returns rendered test for students from cache
+
+    Payload is cached by content version of test, so any change of test makes new entry.
+    Only one worker builds missing entry, others wait for it to appear in cache.
+    """
+    key = f'public-test:{test.pk}:{test.content_version}'
+    payload = cache.get(key)
+    if payload is not None:
+        return payload
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, timeout=settings.PUBLIC_TEST_BUILD_TIMEOUT):
+        try:
+            payload = build()
+            cache.set(key, payload, timeout=settings.PUBLIC_TEST_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return payload
+
+    deadline = time.monotonic() + settings.PUBLIC_TEST_BUILD_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+    # builder failed or is too slow, don't make student wait any longer
+    return build()
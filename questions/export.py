@@ -0,0 +1,127 @@
+import csv
+import itertools
+import re
+import tempfile
+from typing import AsyncIterator, Iterable, Iterator
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from openpyxl import Workbook
+
+from completions.models import Completion
+
+from .models import Test
+
+HEADERS = ['Email', 'ФИ', 'Группа', 'Оценка', 'Дата и время']
+QUESTION_ANALYSIS_HEADERS = [
+    'Номер вопроса', 'Тип', 'Баллы', 'Ответили', 'Пропустили',
+    'Средний балл', 'Трудность', 'Дискриминация',
+]
+VARIANT_ANALYSIS_HEADERS = ['Номер вопроса', 'Вариант', 'Верный', 'Выбрали', 'Доля']
+# completions fetched from server-side cursor at once
+CHUNK_SIZE = 2000
+# blocks of file response read by thread at once
+FILE_BLOCKS_PER_BATCH = 16
+
+
+def get_export_rows(test: Test) -> Iterator[list]:
+    """Yields rows of completions of test, all data is fetched with one streamed query"""
+    user_groups = Group.objects.filter(user=OuterRef('user_id')).order_by('pk').values('name')
+    # choose which group is display for user
+    # option 1: group that user is in and that is allowed for test
+    # option 2: first group of user
+    # option 3: 'Не в группе'
+    group_name = Coalesce(
+        Subquery(user_groups.filter(available_tests=test)[:1]),
+        Subquery(user_groups[:1]),
+        Value('Не в группе'),
+    )
+    completions = (
+        Completion.objects.filter(test=test)
+        .annotate(group_name=group_name)
+        .order_by('created_at', 'pk')
+        .values_list('user__email', 'user__last_name', 'user__first_name', 'group_name', 'score', 'created_at')
+    )
+    for email, last_name, first_name, group, score, created_at in completions.iterator(chunk_size=CHUNK_SIZE):
+        # remove timezone info so excel could properly write this
+        yield [email, last_name + ' ' + first_name, group, score, created_at.replace(tzinfo=None)]
+
+
+class Echo:
+    """File-like object that returns written value, used to stream csv writer output"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(test: Test) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    # byte order mark makes excel open file as utf-8
+    yield '\ufeff'
+    yield writer.writerow(HEADERS)
+    for row in get_export_rows(test):
+        yield writer.writerow(row)
+
+
+async def iterate_in_thread(iterable: Iterable, batch_size: int = CHUNK_SIZE) -> AsyncIterator:
+    """Yields items of sync iterable, taking them by batches in thread of request
+
+    ASGI handler reads whole sync content of streaming response into list before
+    sending it, so export has to be async iterator to be sent while it's built.
+    All batches are taken in the same thread, which keeps server-side cursor usable.
+    """
+    iterator = iter(iterable)
+    take_batch = sync_to_async(lambda: list(itertools.islice(iterator, batch_size)))
+    while batch := await take_batch():
+        for item in batch:
+            yield item
+
+
+def stream_async(response, batch_size: int = CHUNK_SIZE):
+    """Replaces sync content of streaming or file response with async iterator over it"""
+    response.streaming_content = iterate_in_thread(response.streaming_content, batch_size)
+    return response
+
+
+def save_workbook(workbook: Workbook):
+    file = tempfile.TemporaryFile()
+    workbook.save(file)
+    file.seek(0)
+    return file
+
+
+def build_xlsx(test: Test):
+    """Writes completions to temporary xlsx file and returns it
+
+    Workbook in write-only mode keeps written rows on disk, so memory usage
+    doesn't depend on number of completions.
+    """
+    workbook = Workbook(write_only=True)
+    # sheet title is limited by excel
+    sheet = workbook.create_sheet(re.sub(r'[\\/*?:\[\]]', '', test.name)[:31] or 'results')
+    sheet.append(HEADERS)
+    for row in get_export_rows(test):
+        sheet.append(row)
+    return save_workbook(workbook)
+
+
+def build_item_analysis_xlsx(analysis: dict):
+    """Writes item analysis to xlsx file with sheets for questions and variants"""
+    workbook = Workbook(write_only=True)
+    questions = workbook.create_sheet('Вопросы')
+    variants = workbook.create_sheet('Варианты')
+    questions.append(QUESTION_ANALYSIS_HEADERS)
+    variants.append(VARIANT_ANALYSIS_HEADERS)
+    for question in analysis['questions']:
+        questions.append([
+            question['number_in_test'], question['type'], question['points'], question['answered'],
+            question['omitted'], question['mean_points'], question['difficulty'], question['discrimination'],
+        ])
+        for variant in question['variants']:
+            variants.append([
+                question['number_in_test'], variant['text'], variant['is_correct'],
+                variant['count'], variant['frequency'],
+            ])
+    return save_workbook(workbook)
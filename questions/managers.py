@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import Group
+from django.db import models
+from django.db.models.functions import Coalesce
+
+
+def get_questions_prefetch() -> list:
+    """Lookups that load questions of tests with all bodies and variants in constant number of queries"""
+    from .models import Question
+
+    return [
+        models.Prefetch(
+            'questions',
+            queryset=Question.objects.select_related(
+                'textbody', 'radiobody', 'checkbody', 'codebody'
+            ).prefetch_related(
+                'textbody__variants', 'radiobody__variants', 'checkbody__variants'
+            ),
+        ),
+    ]
+
+
+class TestQuerySet(models.QuerySet):
+    def with_questions(self):
+        """Prefetches everything test serializers use"""
+        return self.prefetch_related(
+            *get_questions_prefetch(),
+            models.Prefetch('available_for', queryset=Group.objects.select_related('groupinfo')),
+        )
+
+
+class VariantQuerySet(models.QuerySet):
+    def group_by_question(self, lookup: str, value) -> dict[int, list]:
+        """Filters variants by `lookup` of their question and groups them by question in one query"""
+        variants = self.filter(
+            models.Q(**{f'text_question__question__{lookup}': value})
+            | models.Q(**{f'radio_question__question__{lookup}': value})
+            | models.Q(**{f'check_question__question__{lookup}': value})
+        ).annotate(
+            body_question_id=Coalesce(
+                'text_question__question_id',
+                'radio_question__question_id',
+                'check_question__question_id',
+            )
+        ).order_by('pk')
+        variants_by_question = defaultdict(list)
+        for variant in variants:
+            variants_by_question[variant.body_question_id].append(variant)
+        return variants_by_question
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0020_test_content_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codebody',
+            name='calibration_error',
+            field=models.TextField(blank=True, default='', verbose_name='calibration error'),
+        ),
+        migrations.AddField(
+            model_name='codebody',
+            name='calibration_status',
+            field=models.CharField(blank=True, choices=[('', 'not calibrated'), ('pending', 'pending'), ('done', 'done'), ('failed', 'failed')], default='', max_length=10, verbose_name='limits calibration status'),
+        ),
+        migrations.AddField(
+            model_name='codebody',
+            name='cpu_time_limit',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='cpu time limit, seconds'),
+        ),
+        migrations.AddField(
+            model_name='codebody',
+            name='memory_limit',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='memory limit, bytes'),
+        ),
+        migrations.AddField(
+            model_name='codebody',
+            name='reference_solution',
+            field=models.TextField(blank=True, default='', verbose_name='reference solution'),
+        ),
+        migrations.AddField(
+            model_name='codebody',
+            name='wall_time_limit',
+            field=models.FloatField(blank=True, null=True, verbose_name='wall time limit, seconds'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0021_codebody_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codebody',
+            name='grading_mode',
+            field=models.CharField(choices=[('tests', 'testing code'), ('io', 'expected output')], default='tests', max_length=10, verbose_name='grading mode'),
+        ),
+        migrations.AddField(
+            model_name='codebody',
+            name='io_cases',
+            field=models.JSONField(blank=True, default=list, verbose_name='input and expected output cases'),
+        ),
+        migrations.AlterField(
+            model_name='codebody',
+            name='testing_code',
+            field=models.TextField(blank=True, default='', verbose_name='testing code'),
+        ),
+    ]
@@ -4,6 +4,8 @@ import string
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from .managers import TestQuerySet, VariantQuerySet
+
 
 def get_length_8_uuid() -> str:
     alphabet = string.ascii_lowercase + string.digits
@@ -40,6 +42,8 @@ class Variant(models.Model):
     text = models.CharField(_('variant text'))
     is_correct = models.BooleanField(_('is variant correct'), default=True)
 
+    objects = VariantQuerySet.as_manager()
+
     def __str__(self) -> str:
         return self.text
 
@@ -56,7 +60,37 @@ class TextBody(QuestionBody):
 
 
 class CodeBody(QuestionBody):
-    testing_code = models.TextField(_('testing code'))
+    grading_mode = models.CharField(
+        _('grading mode'),
+        max_length=10,
+        choices=(
+            ('tests', 'testing code'),
+            ('io', 'expected output'),
+        ),
+        default='tests',
+    )
+    # run after code in `tests` mode
+    testing_code = models.TextField(_('testing code'), blank=True, default='')
+    # list of {"input": ..., "output": ...} in `io` mode, every case gives part of points
+    io_cases = models.JSONField(_('input and expected output cases'), default=list, blank=True)
+    # limits of sandbox are derived from resources used by reference solution
+    reference_solution = models.TextField(_('reference solution'), blank=True, default='')
+    calibration_status = models.CharField(
+        _('limits calibration status'),
+        max_length=10,
+        choices=(
+            ('', 'not calibrated'),
+            ('pending', 'pending'),
+            ('done', 'done'),
+            ('failed', 'failed'),
+        ),
+        blank=True,
+        default='',
+    )
+    calibration_error = models.TextField(_('calibration error'), blank=True, default='')
+    cpu_time_limit = models.PositiveIntegerField(_('cpu time limit, seconds'), null=True, blank=True)
+    wall_time_limit = models.FloatField(_('wall time limit, seconds'), null=True, blank=True)
+    memory_limit = models.PositiveBigIntegerField(_('memory limit, bytes'), null=True, blank=True)
 
 
 class RadioBody(QuestionBody):
@@ -75,10 +109,23 @@ class Test(models.Model):
     public_uuid = models.CharField(
         'public uuid', max_length=8, unique=True, blank=True, default=get_length_8_uuid
     )
+    # changed on every change of test, its questions or variants, see `questions.signals`
+    content_version = models.PositiveIntegerField(_('content version'), default=1)
+
+    objects = TestQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        # content version is only incremented in database, so stale value of instance is never written back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'content_version'
+            ]
+        super().save(*args, **kwargs)
+
     def regenerate_uuid(self):
         self.public_uuid = get_length_8_uuid()
         self.save()
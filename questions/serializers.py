@@ -20,12 +20,20 @@ class VariantSerializer(serializers.ModelSerializer):
         fields = ('id', 'text')
         read_only_fields = ('id', )
 
+class IOCaseSerializer(serializers.Serializer):
+    # whitespace of input and output is a part of case
+    input = serializers.CharField(allow_blank=True, trim_whitespace=False)
+    output = serializers.CharField(allow_blank=True, trim_whitespace=False)
+
 @extend_schema_serializer(
     exclude_fields=('question',)
 )
 class BodyCreationSerializer(serializers.Serializer):
     variants = VariantIsCorrectSerializer(many=True, required=False)
+    grading_mode = serializers.ChoiceField(choices=CodeBody._meta.get_field('grading_mode').choices, required=False)
     testing_code = serializers.CharField(required=False)
+    io_cases = IOCaseSerializer(many=True, required=False)
+    reference_solution = serializers.CharField(required=False, allow_blank=True)
     question = serializers.PrimaryKeyRelatedField(queryset=Question.objects.all(), required=False)
     strict_score = serializers.BooleanField(required=False)
 
@@ -35,13 +43,24 @@ class BodyCreationSerializer(serializers.Serializer):
             raise ValueError('Question type is not defined')
         match instance.question.type:
             case 'code':
-                return {'testing_code': instance.testing_code}
+                return {
+                    'grading_mode': instance.grading_mode,
+                    'testing_code': instance.testing_code,
+                    'io_cases': instance.io_cases,
+                    'reference_solution': instance.reference_solution,
+                    'calibration_status': instance.calibration_status,
+                    'cpu_time_limit': instance.cpu_time_limit,
+                    'wall_time_limit': instance.wall_time_limit,
+                    'memory_limit': instance.memory_limit,
+                }
             case 'radio':
                 return {'variants': VariantIsCorrectSerializer(instance.variants.all(), many=True).data}
             case 'check':
                 return {'variants': VariantIsCorrectSerializer(instance.variants.all(), many=True).data, 'strict_score': instance.strict_score}
             case 'text':
-                return {'variants': VariantIsCorrectSerializer(instance.variants.filter(is_correct=True), many=True).data}
+                # filtered in python to use prefetched variants
+                correct_variants = [variant for variant in instance.variants.all() if variant.is_correct]
+                return {'variants': VariantIsCorrectSerializer(correct_variants, many=True).data}
             case _:
                 return super().to_representation(instance)
     
@@ -110,6 +129,8 @@ class QuestionCreationSerializer(serializers.ModelSerializer):
                 case 'text':
                     if correct_count < 1:
                         raise serializers.ValidationError('Text question must have at least one correct variant')
+        if qtype == 'code' and body.get('grading_mode') == 'io' and not body.get('io_cases'):
+            raise serializers.ValidationError('Code question graded by output must have at least one case')
         return attrs
 
 class TestCreationSerializer(serializers.ModelSerializer):
@@ -131,7 +152,7 @@ class TestCreationSerializer(serializers.ModelSerializer):
             question_serializer = QuestionCreationSerializer(data=question)
             question_serializer.is_valid(raise_exception=True)
             question_serializer.save()
-        return test
+        return Test.objects.with_questions().get(pk=test.pk)
     
     def validate_questions(self, questions):
         # check if all question numbers in test are unique
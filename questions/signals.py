@@ -0,0 +1,61 @@
+from django.db.models import F, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import CheckBody, CodeBody, Question, RadioBody, Test, TextBody, Variant
+
+BODIES = (TextBody, RadioBody, CheckBody, CodeBody)
+
+
+def bump_content_version(tests):
+    """Invalidates cached content of tests"""
+    tests.update(content_version=F('content_version') + 1)
+
+
+@receiver(post_save, sender=Test)
+def test_changed(sender, instance, created, **kwargs):
+    if not created:
+        bump_content_version(Test.objects.filter(pk=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    bump_content_version(Test.objects.filter(pk=instance.test_id))
+
+
+def body_changed(sender, instance, **kwargs):
+    bump_content_version(Test.objects.filter(questions=instance.question_id))
+
+
+def body_variants_changed(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        variant_changed(Variant, instance)
+    else:
+        body_changed(sender, instance)
+
+
+for Body in BODIES:
+    post_save.connect(body_changed, sender=Body, dispatch_uid=f'{Body.__name__}_changed')
+    post_delete.connect(body_changed, sender=Body, dispatch_uid=f'{Body.__name__}_deleted')
+for Body in BODIES[:3]:
+    m2m_changed.connect(
+        body_variants_changed,
+        sender=Body.variants.through,  # type: ignore
+        dispatch_uid=f'{Body.__name__}_variants_changed',
+    )
+
+
+# variant is unlinked from its question when it's deleted, so tests are found before that
+@receiver([post_save, pre_delete], sender=Variant)
+def variant_changed(sender, instance, created=False, **kwargs):
+    if created:
+        # new variant is not linked to question yet, linking is handled by body_variants_changed
+        return
+    tests = Test.objects.filter(
+        Q(questions__textbody__variants=instance)
+        | Q(questions__radiobody__variants=instance)
+        | Q(questions__checkbody__variants=instance)
+    )
+    bump_content_version(tests)
@@ -1,3 +1,101 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from completions.models import Completion
+from groups.models import GroupInfo
+from organizations.models import Organization
+from users.models import User
+
+from .models import CheckBody, CodeBody, Question, RadioBody, Test, TextBody, Variant
+
+
+class TestQueryCountTests(APITestCase):
+    """Number of queries of test endpoints must not depend on number of questions"""
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(
+            'teacher@example.com', 'password', first_name='T', last_name='T', is_teacher=True
+        )
+        organization = Organization.objects.create(name='organization', owner=self.teacher)
+        self.teacher.organization = organization
+        self.teacher.save()
+        self.student = User.objects.create_user(
+            'student@example.com', 'password', first_name='S', last_name='S', organization=organization
+        )
+        self.group = Group.objects.create(name='group')
+        GroupInfo.objects.create(group=self.group, organization=organization, creator=self.teacher)
+        self.group.user_set.add(self.student)
+
+    def create_test(self, questions_per_type: int) -> Test:
+        test = Test.objects.create(name='test', creator=self.teacher)
+        test.available_for.add(self.group)
+        number = 1
+        for _ in range(questions_per_type):
+            for qtype, Body in (('text', TextBody), ('radio', RadioBody), ('check', CheckBody)):
+                question = Question.objects.create(text=qtype, type=qtype, test=test, number_in_test=number)
+                body = Body.objects.create(question=question)
+                body.variants.set([  # type: ignore
+                    Variant.objects.create(text='right', is_correct=True),
+                    Variant.objects.create(text='wrong', is_correct=False),
+                ])
+                number += 1
+            question = Question.objects.create(text='code', type='code', test=test, number_in_test=number)
+            CodeBody.objects.create(question=question, testing_code='assert True')
+            number += 1
+        return test
+
+    def assertConstantQueries(self, expected_queries, user, get_url):
+        self.client.force_authenticate(user)
+        for questions_per_type in (1, 5):
+            test = self.create_test(questions_per_type)
+            cache.clear()
+            with self.subTest(questions_per_type=questions_per_type):
+                with self.assertNumQueries(expected_queries):
+                    response = self.client.get(get_url(test))
+                self.assertEqual(response.status_code, 200)
+
+    def test_list(self):
+        self.assertConstantQueries(6, self.teacher, lambda test: '/api/tests/')
+
+    def test_retrieve(self):
+        self.assertConstantQueries(7, self.teacher, lambda test: f'/api/tests/{test.pk}/')
+
+    def test_public_retrieve(self):
+        self.assertConstantQueries(7, self.student, lambda test: f'/api/tests/p/{test.public_uuid}/')
+
+
+class ExportTests(APITestCase):
+    """Exports must be streamed by async iterator, or ASGI handler buffers them"""
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(
+            'teacher@example.com', 'password', first_name='T', last_name='T', is_teacher=True
+        )
+        self.test = Test.objects.create(name='test', creator=self.teacher)
+        for number in range(3):
+            student = User.objects.create_user(
+                f'student{number}@example.com', 'password', first_name='S', last_name=f'S{number}'
+            )
+            Completion.objects.create(user=student, test=self.test, status='graded', score=number)
+
+    def read(self, response) -> bytes:
+        async def read_content():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(read_content)()
+
+    def test_csv_is_streamed_asynchronously(self):
+        response = self.client.get(f'/api/tests/{self.test.pk}/completions/export/?file_format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        lines = self.read(response).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn('student2@example.com', lines[3])
+
+    def test_xlsx_is_streamed_asynchronously(self):
+        response = self.client.get(f'/api/tests/{self.test.pk}/completions/export/?file_format=xlsx')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(self.read(response)), int(response['Content-Length']))
@@ -1,12 +1,13 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
-from .views import TestViewSet, PublicTestViewSet
+from .views import TestViewSet, PublicTestViewSet, completion_feed
 
 tests_router = SimpleRouter()
 tests_router.register(r'', TestViewSet, basename='tests')
 tests_router.register(r'p', PublicTestViewSet, basename='public_tests')
 
 urlpatterns = [
+    path('<int:pk>/completions/feed/', completion_feed, name='completion-feed'),
     path('', include(tests_router.urls)),
 ]
@@ -1,20 +1,42 @@
 import datetime as dt
 
-import tablib
-from django.http.response import HttpResponse
-from drf_spectacular.utils import (OpenApiResponse, extend_schema,
-                                   extend_schema_view)
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import JsonResponse
+from django.http.response import FileResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from drf_spectacular.utils import (OpenApiParameter, OpenApiResponse,
+                                   extend_schema, extend_schema_view)
 from rest_framework import mixins, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from completions.analysis import get_item_analysis
+from completions.dry_run import dry_run
+from completions.events import (authenticate, decode_cursor, encode_cursor,
+                                feed_watcher, get_feed_end, get_feed_page,
+                                run_shared, stream_feed)
+from completions.pagination import (COMPLETION_LIST_PARAMETERS,
+                                    get_paginated_completions)
 from completions.serializers import (CompletionCreationSerializer,
-                                     CompletionSerializer)
+                                     CompletionSerializer,
+                                     DryRunResultSerializer,
+                                     DryRunSerializer,
+                                     ItemAnalysisSerializer,
+                                     ResourceUsageSerializer,
+                                     TestStatisticsSerializer)
+from completions.statistics import get_resource_usage, get_test_statistics
+from completions.throttling import DryRunThrottle
 from organizations.permissions import HasOrg
 from users.permissions import IsTeacher
 
-from .models import Test
+from .cache import get_public_test_payload
+from .export import (FILE_BLOCKS_PER_BATCH, build_item_analysis_xlsx,
+                     build_xlsx, stream_async, stream_csv)
+from .managers import get_questions_prefetch
+from .models import CodeBody, Test
 from .permissions import CanPassTest, IsTestCreator
 from .serializers import (AllowToGroupSerializer, TestCreationSerializer,
                           TestSerializer)
@@ -35,7 +57,10 @@ class TestViewSet(
         if self.request.user.is_anonymous:
             return Test.objects.none()
         org = self.request.user.organization  # type: ignore
-        return Test.objects.filter(creator__organization=org)
+        tests = Test.objects.filter(creator__organization=org)
+        if self.action in ('get_completions', 'statistics', 'item_analysis', 'export_item_analysis', 'resource_usage'):
+            return tests
+        return tests.with_questions()
 
     def get_permissions(self):
         match self.action:
@@ -100,37 +125,70 @@ class TestViewSet(
         instance.regenerate_uuid()
         return Response(TestCreationSerializer(instance).data)
 
-    @extend_schema(request=None, responses=CompletionSerializer(many=True))
+    @extend_schema(request=None, responses=CompletionSerializer(many=True), parameters=COMPLETION_LIST_PARAMETERS)
     @action(detail=True, methods=['get'], url_path='completions')
     def get_completions(self, request, pk=None):
-        """Get all completions of test."""
+        """Get completions of test page by page, newest first."""
         instance = self.get_object()
-        return Response(CompletionSerializer(instance.completion_set.all(), many=True).data)
+        completions = instance.completion_set.select_related('user')
+        return get_paginated_completions(request, self, completions, CompletionSerializer)
+
+    @extend_schema(request=None, responses=TestStatisticsSerializer)
+    @action(detail=True, methods=['get'])
+    def statistics(self, request, pk=None):
+        """Get score statistics and correctness of questions of test."""
+        instance = self.get_object()
+        return Response(TestStatisticsSerializer(get_test_statistics(instance)).data)
+
+    @extend_schema(request=None, responses=ResourceUsageSerializer)
+    @action(detail=True, methods=['get'])
+    def resource_usage(self, request, pk=None):
+        """Get cpu time, wall time, memory and exit reasons of sandbox runs of code questions of test."""
+        instance = self.get_object()
+        return Response(ResourceUsageSerializer(get_resource_usage(instance)).data)
+
+    @extend_schema(request=None, responses=ItemAnalysisSerializer)
+    @action(detail=True, methods=['get'])
+    def item_analysis(self, request, pk=None):
+        """Get difficulty, discrimination and variant frequencies of questions of test."""
+        instance = self.get_object()
+        return Response(ItemAnalysisSerializer(get_item_analysis(instance)).data)
 
     @extend_schema(request=None, responses={200: bytes})
+    @action(detail=True, methods=['get'], url_path='item_analysis/export')
+    def export_item_analysis(self, request, pk=None):
+        """Get item analysis of test in xlsx format."""
+        instance = self.get_object()
+        return stream_async(FileResponse(
+            build_item_analysis_xlsx(get_item_analysis(instance)),
+            as_attachment=True,
+            filename='item_analysis.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        ), FILE_BLOCKS_PER_BATCH)
+
+    @extend_schema(
+        request=None,
+        responses={200: bytes},
+        parameters=[OpenApiParameter('file_format', enum=['xlsx', 'csv'], default='xlsx')],
+    )
     @action(detail=True, methods=['get'], url_path='completions/export')
     def export_completions(self, request, pk=None):
-        """Get completions of test in xlsx format."""
+        """Get completions of test in xlsx or csv format."""
         instance = self.get_object()
-        completions = instance.completion_set.all()
-        headers = ['Email', 'ФИ', 'Группа', 'Оценка', 'Дата и время']
-        data = []
-        data = tablib.Dataset(*data, headers=headers, title=instance.name)
-        for c in completions:
-            # remove timezone info so excel could properly write this
-            created_at_without_tz = c.created_at.replace(tzinfo=None)
-            # choose which group is display for user
-            # option 1: group that user is in and that is allowed for test
-            # option 2: first group of user
-            # option 3: 'Не в группе'
-            group = (c.user.groups.filter() & c.test.available_for.all()
-                     ).first() or c.user.groups.first() or 'Не в группе'
-            data.append([c.user.email, c.user.last_name + ' ' + c.user.first_name,
-                        group, c.score, created_at_without_tz])
-        response = HttpResponse(data.export('xlsx'),
-                                content_type='application/vnd.ms-excel;charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename=results.xlsx'
-        return response
+        match request.query_params.get('file_format', 'xlsx'):
+            case 'csv':
+                response = StreamingHttpResponse(stream_csv(instance), content_type='text/csv;charset=utf-8')
+                response['Content-Disposition'] = 'attachment; filename=results.csv'
+                return stream_async(response)
+            case 'xlsx':
+                return stream_async(FileResponse(
+                    build_xlsx(instance),
+                    as_attachment=True,
+                    filename='results.xlsx',
+                    content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                ), FILE_BLOCKS_PER_BATCH)
+            case _:
+                raise ValidationError({'file_format': 'Format must be xlsx or csv'})
 
 
 class PublicTestViewSet(
@@ -142,13 +200,79 @@ class PublicTestViewSet(
     serializer_class = TestSerializer
     lookup_field = 'public_uuid'
 
-    @extend_schema(responses=CompletionCreationSerializer(many=True))
+    @extend_schema(responses=CompletionCreationSerializer(many=True), parameters=COMPLETION_LIST_PARAMETERS)
     @action(detail=True, methods=['get'], url_path='completions')
     def get_completions(self, request, public_uuid=None):
-        """Get all completions of current student of current test."""
+        """Get completions of current student of current test page by page, newest first."""
+        instance = self.get_object()
+        completions = instance.completion_set.filter(user=self.request.user)
+        return get_paginated_completions(request, self, completions, CompletionCreationSerializer)
+
+    @extend_schema(request=DryRunSerializer, responses={200: DryRunResultSerializer})
+    @action(detail=True, methods=['post'], throttle_classes=[DryRunThrottle])
+    def run_code(self, request, public_uuid=None):
+        """Check code answer to question of test without submitting completion"""
         instance = self.get_object()
-        return Response(CompletionCreationSerializer(instance.completion_set.filter(user=self.request.user), many=True).data)
+        serializer = DryRunSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        code_body = CodeBody.objects.filter(
+            question=serializer.validated_data['question'], question__test=instance
+        ).first()
+        if code_body is None:
+            raise ValidationError({'question': 'Question must be code question of this test'})
+        result = dry_run(serializer.validated_data['code'], code_body)
+        return Response(DryRunResultSerializer(result).data)
 
     def retrieve(self, request, *args, **kwargs):
         """Get test for completion (only students!)"""
-        return super().retrieve(request, *args, **kwargs)
+        instance = self.get_object()
+        payload = get_public_test_payload(instance, lambda: self._render(instance))
+        return Response(payload)
+
+    def _render(self, instance):
+        prefetch_related_objects([instance], *get_questions_prefetch())
+        return dict(self.get_serializer(instance).data)
+
+
+@require_GET
+async def completion_feed(request, pk):
+    """New and graded completions of test for its creator, served by ASGI app
+
+    Completions changed after `cursor` are returned in order of change as (user, score, status),
+    completion comes again with the same `id` when it's graded. Without cursor feed starts at
+    the last change, older completions are listed by `completions`. With `Accept: text/event-stream`
+    completions are streamed as server-sent events. Otherwise it's long-poll that answers
+    when completions change or after `GRADING_STATUS_TIMEOUT` seconds.
+    """
+    user = await run_shared(authenticate, request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    test = await run_shared(Test.objects.filter(pk=pk, creator=user).first)
+    if test is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    try:
+        cursor = decode_cursor(request.headers.get('Last-Event-ID') or request.GET.get('cursor', ''))
+    except ValueError:
+        return JsonResponse({'cursor': 'Invalid cursor'}, status=400)
+    if cursor is None:
+        cursor = await run_shared(get_feed_end, test.pk)
+
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        return StreamingHttpResponse(
+            stream_feed(test.pk, cursor),
+            content_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+    page_size = settings.COMPLETION_FEED_PAGE_SIZE
+    page = await run_shared(get_feed_page, test.pk, cursor, page_size)
+    if not page and 'cursor' in request.GET:
+        head = await feed_watcher.get(test.pk)
+        if head is not None and await feed_watcher.wait(test.pk, head, settings.GRADING_STATUS_TIMEOUT) != head:
+            page = await run_shared(get_feed_page, test.pk, cursor, page_size)
+    if page:
+        cursor = page[-1][0]
+    return JsonResponse({
+        'completions': [completion for _, completion in page],
+        'cursor': encode_cursor(cursor),
+        'has_more': len(page) == page_size,
+    })
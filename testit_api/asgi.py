@@ -2,6 +2,10 @@
 ASGI config for testit_api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+It's served by ``gunicorn -k uvicorn.workers.UvicornWorker testit_api.asgi:application``,
+so waiting clients of async views, like grading status, don't hold threads.
+Streaming responses, like exports, must have async content: sync content is read
+whole into memory by the handler before it's sent.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -184,3 +185,102 @@ GRAPH_MODELS = {
 # xlsx export
 FILE_UPLOAD_HANDLERS = ("django_excel.ExcelMemoryFileUploadHandler",
                         "django_excel.TemporaryExcelFileUploadHandler")
+
+# Grading queue settings
+# seconds between queue checks when there are no jobs
+GRADING_WORKER_POLL_INTERVAL = float(os.environ.get('GRADING_WORKER_POLL_INTERVAL', 1))
+# seconds after which running job is considered abandoned by worker
+GRADING_JOB_LEASE = int(os.environ.get('GRADING_JOB_LEASE', 300))
+GRADING_JOB_MAX_ATTEMPTS = int(os.environ.get('GRADING_JOB_MAX_ATTEMPTS', 3))
+# seconds job given back to queue waits before it's claimed again
+GRADING_RETRY_DELAY = int(os.environ.get('GRADING_RETRY_DELAY', 30))
+# answer that ran out of wall time getting less than this share of it as cpu time
+# waited for busy sandbox, it's run again in next attempt of job instead of graded
+GRADING_CONTENDED_CPU_SHARE = float(os.environ.get('GRADING_CONTENDED_CPU_SHARE', 0.5))
+# seconds of recent jobs of organization that decide its turn within priority class
+GRADING_FAIR_SHARE_WINDOW = int(os.environ.get('GRADING_FAIR_SHARE_WINDOW', 60))
+# seconds of started jobs that queue latency metrics are computed from
+GRADING_METRICS_WINDOW = int(os.environ.get('GRADING_METRICS_WINDOW', 60 * 60))
+# seconds between checks of grading status of completions that clients wait for
+GRADING_STATUS_POLL_INTERVAL = float(os.environ.get('GRADING_STATUS_POLL_INTERVAL', 1))
+# seconds long-poll request waits for change, also interval of keep-alive comments of event stream
+GRADING_STATUS_TIMEOUT = float(os.environ.get('GRADING_STATUS_TIMEOUT', 30))
+# seconds between checks for new completions of tests that teachers watch
+COMPLETION_FEED_POLL_INTERVAL = float(os.environ.get('COMPLETION_FEED_POLL_INTERVAL', 1))
+# completions returned by one response of feed
+COMPLETION_FEED_PAGE_SIZE = int(os.environ.get('COMPLETION_FEED_PAGE_SIZE', 100))
+# seconds event stream is kept open, client reconnects after that
+GRADING_STATUS_STREAM_TIMEOUT = float(os.environ.get('GRADING_STATUS_STREAM_TIMEOUT', 5 * 60))
+
+# Sandbox pool settings
+# number of pre-started sandbox zygotes per process, 0 starts new interpreter for every run
+SANDBOX_POOL_SIZE = int(os.environ.get('SANDBOX_POOL_SIZE', 2))
+# zygote is restarted after this number of jobs or seconds
+SANDBOX_POOL_MAX_JOBS = int(os.environ.get('SANDBOX_POOL_MAX_JOBS', 500))
+SANDBOX_POOL_MAX_AGE = int(os.environ.get('SANDBOX_POOL_MAX_AGE', 3600))
+# number of code answers of one completion run in parallel, i.e. cores used by one zygote
+SANDBOX_SUBMISSION_PARALLELISM = int(os.environ.get('SANDBOX_SUBMISSION_PARALLELISM', 4))
+# bytes of stdout and stderr kept from one run, code that writes more is killed
+SANDBOX_OUTPUT_LIMIT = int(os.environ.get('SANDBOX_OUTPUT_LIMIT', 64 * 1024))
+# number of sandbox results kept in memory of process, 0 disables cache
+SANDBOX_RESULT_CACHE_SIZE = int(os.environ.get('SANDBOX_RESULT_CACHE_SIZE', 10000))
+# sandbox sessions running at once on host, shared by all processes through lock files,
+# every session runs up to SANDBOX_SUBMISSION_PARALLELISM children, 0 disables limit
+SANDBOX_SLOTS = int(os.environ.get('SANDBOX_SLOTS', 2))
+SANDBOX_SLOTS_DIR = os.environ.get('SANDBOX_SLOTS_DIR', os.path.join(tempfile.gettempdir(), 'testit-sandbox-slots'))
+# requests waiting for free slot, requests over it are answered with 429
+SANDBOX_QUEUE_SIZE = int(os.environ.get('SANDBOX_QUEUE_SIZE', 16))
+# seconds between checks of slots by waiting request
+SANDBOX_SLOT_POLL_INTERVAL = float(os.environ.get('SANDBOX_SLOT_POLL_INTERVAL', 0.05))
+# seconds request waits for free slot before it's answered with 429,
+# it holds request worker meanwhile, so it's short
+SANDBOX_QUEUE_TIMEOUT = float(os.environ.get('SANDBOX_QUEUE_TIMEOUT', 2))
+# seconds clients are asked to wait before retrying rejected request
+SANDBOX_RETRY_AFTER = int(os.environ.get('SANDBOX_RETRY_AFTER', 5))
+# pending grading jobs after which submissions with code answers are rejected, 0 for no limit
+GRADING_MAX_BACKLOG = int(os.environ.get('GRADING_MAX_BACKLOG', 0))
+# check runs of code answer a student can make at once and runs per minute added after that
+DRY_RUN_BURST = int(os.environ.get('DRY_RUN_BURST', 5))
+DRY_RUN_RATE = float(os.environ.get('DRY_RUN_RATE', 6))
+# seconds result of check run is kept in cache
+DRY_RUN_CACHE_TIMEOUT = int(os.environ.get('DRY_RUN_CACHE_TIMEOUT', 10 * 60))
+# characters of errors of check run returned to student, the end of errors is kept
+DRY_RUN_ERRORS_LIMIT = int(os.environ.get('DRY_RUN_ERRORS_LIMIT', 1000))
+# number of completions with outdated score rescored by worker at once
+GRADING_RESCORE_BATCH_SIZE = int(os.environ.get('GRADING_RESCORE_BATCH_SIZE', 500))
+# number of completions rescored by one UPDATE after answer key of question is changed
+ANSWER_KEY_RESCORE_BATCH_SIZE = int(os.environ.get('ANSWER_KEY_RESCORE_BATCH_SIZE', 5000))
+
+# Cache settings
+# cache must be shared by all workers (memcached, redis) for request coalescing to work across processes
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+# seconds rendered test for students is kept in cache
+PUBLIC_TEST_CACHE_TIMEOUT = int(os.environ.get('PUBLIC_TEST_CACHE_TIMEOUT', 24 * 60 * 60))
+# seconds other workers wait for cache entry that is being built
+PUBLIC_TEST_BUILD_TIMEOUT = int(os.environ.get('PUBLIC_TEST_BUILD_TIMEOUT', 10))
+# seconds item analysis of test is kept in cache, entry is also replaced when completions change
+ITEM_ANALYSIS_CACHE_TIMEOUT = int(os.environ.get('ITEM_ANALYSIS_CACHE_TIMEOUT', 24 * 60 * 60))
+
+# Regrade settings
+# processes that run code answers during regrade, each of them uses its own sandbox pool
+REGRADE_PROCESSES = int(os.environ.get('REGRADE_PROCESSES', 2))
+# code answers regraded between checkpoints
+REGRADE_BATCH_SIZE = int(os.environ.get('REGRADE_BATCH_SIZE', 200))
+
+# Sandbox limits calibration settings
+# limits of question are this many times more than resources used by reference solution
+SANDBOX_LIMIT_FACTOR = float(os.environ.get('SANDBOX_LIMIT_FACTOR', 5))
+# wall time limit is also multiplied by this, reference solution runs alone
+# while answers share cpus with other children of parallel sandbox sessions
+SANDBOX_WALL_TIME_HEADROOM = float(os.environ.get('SANDBOX_WALL_TIME_HEADROOM', 2))
+# limits are never lower than these
+SANDBOX_MIN_CPU_TIME = int(os.environ.get('SANDBOX_MIN_CPU_TIME', 1))
+SANDBOX_MIN_WALL_TIME = float(os.environ.get('SANDBOX_MIN_WALL_TIME', 2))
+SANDBOX_MIN_MEMORY = int(os.environ.get('SANDBOX_MIN_MEMORY', 256 * 1024 * 1024))
+# number of runs of reference solution, the slowest one is used
+SANDBOX_CALIBRATION_RUNS = int(os.environ.get('SANDBOX_CALIBRATION_RUNS', 3))
@@ -1,3 +1,31 @@
-from django.test import TestCase
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from completions.models import Completion
+from questions.models import Test
+
+from .models import User
+
+
+class CompletionListQueryCountTests(APITestCase):
+    """Number of queries of completion listing must not depend on number of completions"""
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(
+            'teacher@example.com', 'password', first_name='T', last_name='T', is_teacher=True
+        )
+        self.student = User.objects.create_user('student@example.com', 'password', first_name='S', last_name='S')
+
+    def test_my_completions(self):
+        self.client.force_authenticate(self.student)
+        created = 0
+        for completions in (2, 7):
+            # every completion is of its own test
+            for _ in range(completions - created):
+                test = Test.objects.create(name='test', creator=self.teacher)
+                Completion.objects.create(user=self.student, test=test, status='graded', score=0)
+            created = completions
+            with self.subTest(completions=completions):
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/users/me/completions/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), completions)
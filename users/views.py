@@ -7,6 +7,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from drf_spectacular.utils import extend_schema
 
+from completions.pagination import COMPLETION_LIST_PARAMETERS, get_paginated_completions
 from completions.serializers import CompletionCreationSerializer
 
 from .serializers import *
@@ -55,13 +56,12 @@ class CurrentUserViewSet(mixins.RetrieveModelMixin,
     def get_object(self):
         return self.request.user
     
-    @extend_schema(responses=CompletionCreationSerializer(many=True))
+    @extend_schema(responses=CompletionCreationSerializer(many=True), parameters=COMPLETION_LIST_PARAMETERS)
     @action(methods=['get'], detail=True, url_name='get_completions')
     def get_completions(self, request, obj=None):
-        """Get all completions of current user. (students only!)"""
-        completions = self.get_object().completion_set.all() # type: ignore
-        serializer = CompletionCreationSerializer(completions, many=True)
-        return Response(serializer.data)
+        """Get completions of current user page by page, newest first. (students only!)"""
+        completions = self.get_object().completion_set.select_related('test') # type: ignore
+        return get_paginated_completions(request, self, completions, CompletionCreationSerializer)
     
     def retrieve(self, request, *args, **kwargs):
         """Get info about current user."""